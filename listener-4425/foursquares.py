@@ -1,19 +1,51 @@
 #!/usr/bin/env python3
 
+import os
+import pickle
+import tempfile
+from array import array
+from math import isqrt
+
 ##################################
 # PUBLIC INTERFACE
 ##################################
 
-# This file implements a dictionary of the sum of square solutions for n, where
+# This file implements a table of the sum of square solutions for n, where
 #  n = a^2 + b^2 + c^2 + d^2, and a to d are rangebound from [0..25], and a >= b >= c >= d
 # A solution is determined according to precedence rules which favours a minimum number
 # of squares when there are two solutions, i.e. d, c, or b = 0, and thereafter, larger leading numbers,
 # e.g. 18 = 3^2 + 3^2 = 4^2 + 1^2 + 1^2, however [3 3 0 0] is the solution for 18 due to fewer digits required.
 # 55 = 5^2 + 5^2 + 2^2 1^2 = 7^2 + 2^2 + 1^2 + 1^2, however [7 2 1 1] is preferred due to larger leading numbers (7 > 5)
+#
+#
+# squares_table(max_value, squares) gives the same for other ranges and numbers of squares, for variants of the puzzle.
+# Tables are built on first use rather than on import, and saved to a cache file (under $FOURSQUARES_CACHE, by default
+# ~/.cache/listener-4425) for later processes to load.
 
 
 def get_foursquare(num):
-    return FOURSQUARES.get(num)
+    return _table().get(num)
+
+
+def foursquares_like(letters):
+    """
+    all the solutions, as tuples padded with zeros, whose numbers are equal where the letters are equal and decrease
+    where they differ, e.g. for 'GGGD' every (a, a, a, b) with a > b which is a solution
+    """
+    return _by_pattern(_table()).get(_pattern(letters), [])
+
+
+def squares_table(max_value=None, squares=None):
+    """the table of sum of square solutions for up to squares squares of numbers up to max_value"""
+    key = (MAX_VALUE if max_value is None else max_value, SQUARES if squares is None else squares)
+    table = _tables.get(key)
+    if table is None:
+        table = _load_cache(*key)
+        if table is None:
+            table = build_table(*key)
+            _save_cache(table)
+        _tables[key] = table
+    return table
 
 
 def get_foursquare_inv(nums):
@@ -29,7 +61,26 @@ def is_foursquare(nums):
 # IMPLEMENTATION
 ##################################
 
-FOURSQUARES = {}
+MAX_VALUE = 25
+SQUARES = 4
+
+# bump when the contents of the table change, so that old cache files are ignored
+CACHE_VERSION = 2
+
+CACHE_DIR = os.environ.get('FOURSQUARES_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'listener-4425'))
+
+# tables built or loaded so far, by (max_value, squares)
+_tables = {}
+
+# the solutions of each table, by the pattern of equal numbers in them
+_patterns = {}
+
+
+def __getattr__(name):
+    # FOURSQUARES is still available as a module attribute, built when it is first looked at
+    if name == 'FOURSQUARES':
+        return _table()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
 def _regularise_numbers(numbers: list):
@@ -49,21 +100,145 @@ def sum_of_squares(lst: list):
     return sum(n * n for n in lst)
 
 
-def _init():
-    for i in range(26):
-        for j in range(26):
-            for k in range(26):
-                for l in range(26):
-                    nums = _regularise_numbers([i, j, k, l])
-                    total = sum_of_squares(nums)
-                    if total in FOURSQUARES:
-                        old = FOURSQUARES[total]
-                        if len(nums) < len(old):
-                            FOURSQUARES[total] = nums
-                        elif len(nums) == len(old) and nums > old:
-                            FOURSQUARES[total] = nums
-                    else:
-                        FOURSQUARES[total] = nums
-
-_init()
-
+class SquaresTable:
+    """
+    The preferred sum of squares for every total, kept in arrays rather than a dict of lists: the terms of each
+    total's solution, padded with zeros, in a row of `squares` numbers, and the number of non-zero terms, or -1 for
+    a total which isn't a sum of that many squares.
+    """
+
+    def __init__(self, max_value, squares, terms, counts):
+        self.max_value = max_value
+        self.squares = squares
+        self.terms = terms
+        self.counts = counts
+
+    def get(self, total, default=None):
+        if not 0 <= total < len(self.counts) or self.counts[total] < 0:
+            return default
+        start = total * self.squares
+        return self.terms[start:start + self.counts[total]].tolist()
+
+    def __getitem__(self, total):
+        nums = self.get(total)
+        if nums is None:
+            raise KeyError(total)
+        return nums
+
+    def __contains__(self, total):
+        return self.get(total) is not None
+
+    def __eq__(self, other):
+        return (isinstance(other, SquaresTable) and (self.max_value, self.squares) == (other.max_value, other.squares)
+                and self.terms == other.terms and self.counts == other.counts)
+
+
+def build_table(max_value=MAX_VALUE, squares=SQUARES):
+    """
+    Rather than trying every combination of numbers, for each count of squares c this works out, for every total,
+    the least possible largest term of c squares adding up to it.  Then the solution for each total is the fewest
+    squares that can make it up, taking each term in turn as the largest that leaves a remainder which the rest of the
+    squares, no larger, can still make up.  This is what makes values up to a few hundred practical.
+    """
+    none = max_value + 1
+    least = [array('H', [0])]
+    for count in range(1, squares):
+        least.append(_least_largest(least[-1], count, max_value, none))
+    totals = squares * max_value * max_value + 1
+    terms = array('H', [0]) * (totals * squares)
+    counts = array('b', [-1]) * totals
+    for total in range(totals):
+        count = squares
+        for c in range(squares):
+            if total < len(least[c]) and least[c][total] <= max_value:
+                count = c
+                break
+        start = total * squares
+        rest = total
+        largest = max_value
+        for left in range(count, 0, -1):
+            previous = least[left - 1]
+            n = min(largest, isqrt(rest))
+            while n * n * left >= rest and not (rest - n * n < len(previous) and previous[rest - n * n] <= n):
+                n -= 1
+            if n * n * left < rest:
+                # only possible when trying the most squares: the total can't be made up at all
+                break
+            terms[start + count - left] = n
+            rest -= n * n
+            largest = n
+        else:
+            counts[total] = count
+    return SquaresTable(max_value, squares, terms, counts)
+
+
+def _least_largest(previous, count, max_value, none):
+    """for every total, the least largest term of count squares of 1 to max_value making it up, or none"""
+    size = count * max_value * max_value + 1
+    least = array('H', [none]) * size
+    for total in range(1, size):
+        # the largest term is at least the root of an equal share of the total
+        n = max(1, isqrt(total // count))
+        while n * n * count < total:
+            n += 1
+        top = min(max_value, isqrt(total))
+        while n <= top:
+            rest = total - n * n
+            if rest < len(previous) and previous[rest] <= n:
+                least[total] = n
+                break
+            n += 1
+    return least
+
+
+def _pattern(items):
+    """the pattern of equal items, with a letter for each distinct item in the order they appear, e.g. 'ZXDD' -> 'ABCC'"""
+    letters = {}
+    return ''.join(letters.setdefault(item, chr(ord('A') + len(letters))) for item in items)
+
+
+def _by_pattern(table: SquaresTable):
+    """the solutions of table, padded with zeros, grouped by the pattern of equal numbers in them"""
+    key = (table.max_value, table.squares)
+    if key not in _patterns:
+        by_pattern = {}
+        for total in range(len(table.counts)):
+            if table.counts[total] >= 0:
+                start = total * table.squares
+                nums = tuple(table.terms[start:start + table.squares])
+                by_pattern.setdefault(_pattern(nums), []).append(nums)
+        _patterns[key] = by_pattern
+    return _patterns[key]
+
+
+def _table():
+    return squares_table()
+
+
+def _cache_path(max_value=MAX_VALUE, squares=SQUARES):
+    return os.path.join(CACHE_DIR, 'foursquares-v{}-{}-{}.pickle'.format(CACHE_VERSION, max_value, squares))
+
+
+def _load_cache(max_value=MAX_VALUE, squares=SQUARES):
+    try:
+        with open(_cache_path(max_value, squares), 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+
+def _save_cache(table: SquaresTable):
+    """writes the cache file under a temporary name and renames it, so that no process ever reads half a file"""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix='.foursquares-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(table, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, _cache_path(table.max_value, table.squares))
+        except:
+            os.remove(temp_path)
+            raise
+    except OSError:
+        # without somewhere to write the cache, every process builds its own table
+        pass
@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+import foursquares
+
+_cache_dir = None
+
+
+def setUpModule():
+    # keep the tables these tests build out of the real cache
+    global _cache_dir
+    _cache_dir = foursquares.CACHE_DIR
+    foursquares.CACHE_DIR = tempfile.mkdtemp()
+    foursquares._tables.clear()
+
+
+def tearDownModule():
+    shutil.rmtree(foursquares.CACHE_DIR)
+    foursquares.CACHE_DIR = _cache_dir
+    foursquares._tables.clear()
+
+
+class FoursquaresTests(unittest.TestCase):
+    def test_fewer_squares_first(self):
+        self.assertEqual(foursquares.get_foursquare(18), [3, 3])
+
+    def test_larger_leading_numbers(self):
+        self.assertEqual(foursquares.get_foursquare(55), [7, 2, 1, 1])
+        self.assertTrue(foursquares.is_foursquare([7, 2, 1, 1]))
+        self.assertFalse(foursquares.is_foursquare([5, 5, 2, 1]))
+
+    def test_by_letter_pattern(self):
+        ggd = foursquares.foursquares_like('GGGD')
+        self.assertIn((22, 22, 22, 2), ggd)
+        self.assertNotIn((5, 5, 5, 1), ggd)
+        self.assertTrue(all(a == b == c > d for (a, b, c, d) in ggd))
+        self.assertEqual(len(ggd), len([(a, a, a, d) for a in range(26) for d in range(a)
+                                        if foursquares.is_foursquare([a, a, a, d])]))
+        self.assertIn((7, 2, 1, 1), foursquares.foursquares_like('ZXDD'))
+        self.assertNotIn((5, 4, 1, 1), foursquares.foursquares_like('ZXDD'))
+        self.assertIn((3, 3, 0, 0), foursquares.foursquares_like('GGDD'))
+        self.assertEqual(foursquares.foursquares_like('GDGX'), [])
+
+    def test_other_ranges(self):
+        table = foursquares.build_table(10, 3)
+        self.assertEqual(table[7 * 7 + 1], [7, 1])
+        self.assertNotIn(7, table)
+        self.assertEqual(foursquares.build_table(10)[7], [2, 1, 1, 1])
+        table = foursquares.build_table(300, 2)
+        self.assertEqual(table[300 * 300 + 1], [300, 1])
+        self.assertEqual(table[2 * 300 * 300], [300, 300])
+
+
+class CacheTests(unittest.TestCase):
+    def setUp(self):
+        # an empty cache of its own for each test
+        self.module_cache_dir = foursquares.CACHE_DIR
+        foursquares.CACHE_DIR = tempfile.mkdtemp()
+        foursquares._tables.clear()
+
+    def tearDown(self):
+        shutil.rmtree(foursquares.CACHE_DIR)
+        foursquares.CACHE_DIR = self.module_cache_dir
+        foursquares._tables.clear()
+
+    def test_built_then_loaded(self):
+        table = foursquares.FOURSQUARES
+        self.assertTrue(os.path.exists(foursquares._cache_path()))
+        foursquares._tables.clear()
+        self.assertEqual(foursquares._load_cache(), table)
+        self.assertEqual(os.listdir(foursquares.CACHE_DIR), [os.path.basename(foursquares._cache_path())])
+
+    def test_cached_by_range(self):
+        self.assertEqual(foursquares.squares_table(10, 3)[50], [7, 1])
+        self.assertTrue(os.path.exists(foursquares._cache_path(10, 3)))
+        self.assertFalse(os.path.exists(foursquares._cache_path()))
+
+    def test_damaged_cache_is_rebuilt(self):
+        with open(foursquares._cache_path(), 'wb') as f:
+            f.write(b'not a pickle')
+        self.assertEqual(foursquares.get_foursquare(18), [3, 3])
+        self.assertEqual(foursquares._load_cache()[55], [7, 2, 1, 1])
@@ -122,8 +122,8 @@ def reduce_with_clue2(possibles, possible_pairs, clue):
     for X = A^2 + B^2 + C^2 + D^2, there must be no combination of smaller list of squares which equals X,
     and there must be no answer of the same number of squares, which has higher numbers.
 
-    This function therefore calculates all values of X for all possible values of letters l1, l2, l3, l4,
-    and regards those given values of l1, l2, l3, l4 where those values are the highest precedence four-square
+    This function therefore goes through the highest precedence four-squares with the clue's pattern of equal
+    letters (see foursquares.foursquares_like()), and regards those whose values are all possible for l1, l2, l3, l4
     as valid candidates for those letters.
 
     Note that this function has been adapted from reduce_with_clue() to include reduction of paired correlated values,
@@ -144,34 +144,19 @@ def reduce_with_clue2(possibles, possible_pairs, clue):
     good3s = set()
     good4s = set()
     new_pairs = PossiblePairs.blank_possibles([l1, l2, l3, l4])
-    for n4 in possibles[l4]:
-        if l3 == l4:
-            l3it = [n4]
-        else:
-            # required that n3 < n4
-            l3it = possibles[l3] - set(range(n4 + 1))
-        for n3 in l3it:
-            if l2 == l3:
-                l2it = [n3]
-            else:
-                # required that n2 < n3
-                l2it = possibles[l2] - set(range(n3 + 1))
-            for n2 in l2it:
-                if l1 == l2:
-                    l1it = [n2]
-                else:
-                    # required that n1 < n2
-                    l1it = possibles[l1] - set(range(n2 + 1))
-                for n1 in l1it:
-                    # added an extra constraint that a solution must be longer than a single digit
-                    if (foursquares.is_foursquare([n1, n2, n3, n4]) and
-                            foursquares.sum_of_squares([n1, n2, n3, n4]) > 9 and
-                            possible_pairs.are_possible_pairs({l1: n1, l2: n2, l3: n3, l4: n4})):
-                        good1s.add(n1)
-                        good2s.add(n2)
-                        good3s.add(n3)
-                        good4s.add(n4)
-                        new_pairs.add_possible_pairs({l1: n1, l2: n2, l3: n3, l4: n4})
+    # n1 > n2 > n3 > n4, other than where letters are the same, so only the solutions with the clue's pattern of
+    # equal letters need looking at
+    for (n1, n2, n3, n4) in foursquares.foursquares_like([l1, l2, l3, l4]):
+        if not (n1 in possibles[l1] and n2 in possibles[l2] and n3 in possibles[l3] and n4 in possibles[l4]):
+            continue
+        # added an extra constraint that a solution must be longer than a single digit
+        if (foursquares.sum_of_squares([n1, n2, n3, n4]) > 9 and
+                possible_pairs.are_possible_pairs({l1: n1, l2: n2, l3: n3, l4: n4})):
+            good1s.add(n1)
+            good2s.add(n2)
+            good3s.add(n3)
+            good4s.add(n4)
+            new_pairs.add_possible_pairs({l1: n1, l2: n2, l3: n3, l4: n4})
 
     possibles[l1].intersection_update(good1s)
     possibles[l2].intersection_update(good2s)
@@ -0,0 +1,127 @@
+# Anytime search for the sokoban solver, over the same push-level states as
+# pushsearch.
+#
+# A greedy best-first search, guided by the matching lower bound alone, finds
+# a solution quickly, though usually with far more pushes than it needs.
+# Then weighted A* searches, with f = g + weight * h for a falling weight,
+# look for better ones, each cutting off any state which can't beat the best
+# solution so far, as g + h is a lower bound on its pushes.  The last, with a
+# weight of 1, is plain A*, and finds the fewest pushes.  A search which runs
+# out of states has shown there's no better solution, and ends the lot.
+#
+# solutions() generates each better solution as it's found, until the time
+# budget runs out, and solve() returns the last of them.  The greedy search
+# always runs to the end, however long it takes, so that there is a solution
+# to return if the level has one; the budget only limits the improvements.
+
+import heapq
+import itertools
+import time
+from sokoban_solver import OPPOSITE
+from pushsearch import normalise, push, push_path, moves_for_pushes
+from informed import box_count, successors
+from patterns import lower_bound
+
+# None for the greedy search
+WEIGHTS = (None, 5, 3, 2, 1.5, 1.25, 1)
+
+# states expanded between looks at the clock
+CHECK_EVERY = 256
+
+
+class OutOfTime(Exception):
+    pass
+
+
+def _search(state, stats, weight, bound, deadline, prune, patterns, monitor):
+    """
+    best-first search of pushes, by g + weight * h, or h alone for a weight of None, returning
+    (push list, pushes) of a solution of fewer than bound pushes, or None if there isn't one.
+    Raises OutOfTime if it isn't done by the deadline.
+    """
+    level = state.level
+    h = lower_bound(level, state.boxes, patterns)
+    if h is None or (bound is not None and h >= bound):
+        return None
+
+    def priority(g, h):
+        return h if weight is None else g + weight * h
+
+    region, _ = normalise(level, state.person, state.boxes)
+    start = (state.boxes, region)
+    best_g = {start: 0}
+    parent = {start: None}
+    counter = itertools.count()
+    open_list = [(priority(0, h), 0, next(counter), start)]
+    generated = 0
+
+    while open_list:
+        _, neg_g, _, key = heapq.heappop(open_list)
+        g = -neg_g
+        if g > best_g[key]:
+            continue
+        boxes, region = key
+        stats['expanded'] += 1
+        if monitor is not None:
+            monitor.update(g, len(open_list), len(best_g), generated)
+        if deadline is not None and not stats['expanded'] % CHECK_EVERY and time.time() > deadline:
+            raise OutOfTime()
+        if boxes == level.targets:
+            return push_path(parent, key), g
+        for box_cell, direction, to_cell, count in successors(level, boxes, region, stats, prune):
+            new_boxes = push(level, boxes, box_cell, to_cell)
+            person = level.neighbours[OPPOSITE[direction]][to_cell]
+            new_key = (new_boxes, normalise(level, person, new_boxes)[0])
+            new_g = g + count
+            generated += 1
+            if new_key in best_g and best_g[new_key] <= new_g:
+                continue
+            h = lower_bound(level, new_boxes, patterns)
+            if h is None or (bound is not None and new_g + h >= bound):
+                continue
+            best_g[new_key] = new_g
+            parent[new_key] = (key, box_cell, direction, to_cell)
+            heapq.heappush(open_list, (priority(new_g, h), -new_g, next(counter), new_key))
+    return None
+
+
+def solutions(state, stats, time_budget=None, weights=WEIGHTS, prune=False, patterns=None, monitor=None):
+    """
+    generates lists of moves solving the level, each with fewer pushes than the last, for up to
+    time_budget seconds if given, searching with each of weights in turn.  The first search isn't
+    cut short by the time budget, so a level with a solution always gets one.
+    """
+    deadline = time.time() + time_budget if time_budget is not None else None
+    level = state.level
+    if box_count(state.boxes) != box_count(level.targets):
+        return
+
+    bound = None
+    for weight in weights:
+        try:
+            # until there's a solution, the search carries on past the deadline
+            found = _search(state, stats, weight, bound, deadline if bound is not None else None,
+                            prune, patterns, monitor)
+        except OutOfTime:
+            return
+        stats['iterations'] += 1
+        if found is None:
+            # nothing better than the last solution, so it has the fewest pushes
+            return
+        push_list, bound = found
+        yield moves_for_pushes(state, push_list)
+
+
+def solve(state, stats, time_budget=None, prune=False, patterns=None, monitor=None, report=None):
+    """
+    anytime search of pushes, returning the list of moves of the best solution found within
+    time_budget seconds (by default with no limit, finding the fewest pushes), or None if there is
+    none.  The first solution is always found, even if that takes longer than time_budget.  Each
+    better solution is passed to report, if given, as it is found.
+    """
+    best = None
+    for moves in solutions(state, stats, time_budget, prune=prune, patterns=patterns, monitor=monitor):
+        best = moves
+        if report is not None:
+            report(moves)
+    return best
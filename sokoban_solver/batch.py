@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+
+# Batch solving of level collections for the sokoban solver.
+#
+# Levels are read one at a time from a collection file (see read_levels), and
+# each is solved in a process of its own, with several running at once.  A
+# level's process is killed if it runs past the time limit, and its address
+# space can be capped, so that one hard level can't hold up or sink the rest.
+#
+# A result is written for every level, in collection order, as a line of
+# JSON, e.g.
+#
+# {"level": 1, "title": "Corners", "status": "solved", "moves": "RRUL", "move_count": 4,
+#  "pushes": 1, "expanded": 27, "seconds": 0.01, "peak_rss_kb": 9012}
+#
+# where status is one of solved, unsolvable, timeout, memory or error, and an
+# error also has the exception raised.  The peak memory includes that of any
+# processes the engine starts, such as the parallel engine's workers.
+
+import collections
+import errno
+import json
+import multiprocessing
+import resource
+import time
+import solutioncache
+from sokoban_solver import BoardState, Level, count_pushes, engines, read_levels
+
+STATUSES = ('solved', 'unsolvable', 'timeout', 'memory', 'error')
+
+
+def _solve(conn, engine, board, target_locations, person, boxes, memory_mb):
+    """
+    solves one level, in a process of its own, sending back
+    (status, moves, expanded, seconds, peak resident memory in KB, error)
+    """
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    stats = collections.Counter()
+    start = time.time()
+    error = None
+    try:
+        level = Level(board, target_locations)
+        moves = engines()[engine](BoardState(level, person, boxes), stats)
+        status = 'unsolvable' if moves is None else 'solved'
+    except MemoryError:
+        moves = None
+        status = 'memory'
+    except Exception as e:
+        moves = None
+        # running out of memory in a system call is an error with ENOMEM rather than a MemoryError
+        status = 'memory' if getattr(e, 'errno', None) == errno.ENOMEM else 'error'
+        error = '{}: {}'.format(type(e).__name__, e)
+    seconds = time.time() - start
+    # with the peaks of any processes the engine started, which the parallel engine adds up for
+    # its workers, running all at once, where RUSAGE_CHILDREN only has the largest of them
+    children = max(stats['worker_peak_rss_kb'], resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + children
+    conn.send((status, moves, stats['expanded'], seconds, peak_rss_kb, error))
+    conn.close()
+
+
+def make_result(number, title, state, status, moves, expanded, seconds, peak_rss_kb=None, error=None):
+    result = collections.OrderedDict()
+    result['level'] = number
+    result['title'] = title
+    result['status'] = status
+    result['moves'] = ''.join(moves) if moves is not None else None
+    result['move_count'] = len(moves) if moves is not None else None
+    result['pushes'] = count_pushes(state, moves) if moves is not None else None
+    result['expanded'] = expanded
+    result['seconds'] = round(seconds, 3)
+    result['peak_rss_kb'] = peak_rss_kb
+    if status == 'error':
+        result['error'] = error
+    return result
+
+
+class Job(object):
+    """ a level being solved """
+
+    def __init__(self, number, title, state, engine, memory_mb):
+        self.number = number
+        self.title = title
+        self.state = state
+        self.memory_mb = memory_mb
+        self.moves = None
+        self.conn, child_conn = multiprocessing.Pipe(duplex=False)
+        level = state.level
+        self.process = multiprocessing.Process(target=_solve, args=(
+            child_conn, engine, level.board, level.target_locations, state.person, state.boxes, memory_mb))
+        self.start = time.time()
+        self.process.start()
+        child_conn.close()
+
+    def poll(self, timeout):
+        """ the result, once the level has been solved, given up on or its process has died, else None """
+        alive = self.process.is_alive()
+        if self.conn.poll():
+            try:
+                return self.finish(*self.conn.recv())
+            except EOFError:
+                alive = False
+        if not alive:
+            # gone without a word, most likely killed for running out of memory
+            status = 'memory' if self.memory_mb else 'error'
+            return self.finish(status, None, 0, time.time() - self.start)
+        if timeout and time.time() - self.start > timeout:
+            self.process.terminate()
+            return self.finish('timeout', None, 0, time.time() - self.start)
+        return None
+
+    def finish(self, status, moves, expanded, seconds, peak_rss_kb=None, error=None):
+        self.process.join()
+        self.conn.close()
+        self.moves = moves
+        return make_result(self.number, self.title, self.state, status, moves, expanded, seconds, peak_rss_kb, error)
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+
+
+def solve_all(levels, engine='bfs', processes=None, timeout=None, memory_mb=None, cache=None,
+              poll_interval=0.01):
+    """
+    Generates a result for each (title, state) of levels, in order, solving up to processes levels
+    at once (by default one per cpu), each within timeout seconds and memory_mb megabytes if given.
+    Levels are looked up in cache, a SolutionCache, first if given, and new solutions added to it.
+    A level given as (title, exception), as read_levels(errors=True) gives one it couldn't read,
+    gets an error result.
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    levels = iter(enumerate(levels, 1))
+    # levels are solved with the engine's default options, so cached under its name alone
+    search = solutioncache.search_key(engine)
+    running = []
+    done = {}
+    next_number = 1
+    exhausted = False
+
+    try:
+        while True:
+            while not exhausted and len(running) < processes:
+                try:
+                    number, (title, state) = next(levels)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if isinstance(state, Exception):
+                    done[number] = make_result(number, title, None, 'error', None, 0, 0,
+                                               error='{}: {}'.format(type(state).__name__, state))
+                    continue
+                moves = cache.get(state, search) if cache else None
+                if moves is not None:
+                    done[number] = make_result(number, title, state, 'solved', moves, 0, 0)
+                else:
+                    running.append(Job(number, title, state, engine, memory_mb))
+
+            if not running:
+                break
+
+            for job in list(running):
+                result = job.poll(timeout)
+                if result is not None:
+                    running.remove(job)
+                    done[job.number] = result
+                    if cache and job.moves is not None:
+                        cache.put(job.state, search, job.moves)
+
+            # results are written in collection order, however they finish
+            while next_number in done:
+                yield done.pop(next_number)
+                next_number += 1
+
+            time.sleep(poll_interval)
+
+        while next_number in done:
+            yield done.pop(next_number)
+            next_number += 1
+
+    finally:
+        for job in running:
+            job.kill()
+
+
+def main():
+    import sys, argparse
+    from sokoban_solver import ENGINE_HELP
+
+    parser = argparse.ArgumentParser(description="sokoban batch solver")
+    parser.add_argument('collection', help="file of levels, in the standard or the two board notation")
+    parser.add_argument('--engine', choices=sorted(engines()), default='bfs', help=ENGINE_HELP)
+    parser.add_argument('--processes', type=int,
+                        help="number of levels solved at once (default: one per cpu)")
+    parser.add_argument('--timeout', type=float,
+                        help="seconds allowed for each level (default: no limit)")
+    parser.add_argument('--memory-mb', type=int,
+                        help="cap on the memory of the process solving each level (default: no limit)")
+    parser.add_argument('--output', help="file for the results (default: standard output)")
+    parser.add_argument('--cache',
+                        help="SQLite file of solutions to look levels up in first, and to add new ones to")
+    parser.add_argument('--cache-mb', type=float,
+                        help="size to keep the cache within, evicting the least recently used solutions "
+                             "(default: no limit)")
+    args = parser.parse_args()
+
+    cache = None
+    if args.cache:
+        import solutioncache
+        max_bytes = int(args.cache_mb * 1024 * 1024) if args.cache_mb is not None else None
+        cache = solutioncache.SolutionCache(args.cache, max_bytes)
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    counts = collections.Counter()
+    with open(args.collection) as f:
+        for result in solve_all(read_levels(f, errors=True), args.engine, args.processes, args.timeout, args.memory_mb, cache):
+            counts[result['status']] += 1
+            print >>out, json.dumps(result)
+            out.flush()
+
+    print >>sys.stderr, ', '.join('{}: {}'.format(status, counts[status]) for status in STATUSES)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+# Benchmarks for the sokoban solver's engines.
+#
+# Each engine is run over a graded set of levels (benchmark-levels.txt by
+# default), one level at a time, each in a fresh process (see batch.py) so
+# that its peak memory can be measured.  For each engine and level the report
+# has the wall time, states expanded, states expanded per second, peak
+# resident memory and the length of the solution, and is written as JSON.
+#
+# A report can be compared against a saved baseline, listing the runs which
+# got slower or bigger beyond a tolerance, or which found a worse solution or
+# none at all, and exiting with status 1 if there were any.
+
+import json
+import os
+import platform
+import sys
+import time
+import batch
+from sokoban_solver import engines, read_levels
+
+LEVELS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark-levels.txt')
+
+# differences in time and memory smaller than these are taken to be noise
+MIN_SECONDS = 0.05
+MIN_RSS_KB = 1024
+
+
+def run(levels, engine_names, timeout=None, memory_mb=None, repeat=1):
+    """
+    Generates a benchmark result for each engine of engine_names and each (title, state) of
+    levels, keeping the fastest of repeat runs of each.
+    """
+    for engine in engine_names:
+        best = {}
+        for _ in xrange(repeat):
+            for result in batch.solve_all(levels, engine, 1, timeout, memory_mb):
+                number = result['level']
+                if number not in best or result['seconds'] < best[number]['seconds']:
+                    best[number] = result
+        for number in sorted(best):
+            result = best[number]
+            result['engine'] = engine
+            result['states_per_second'] = (int(result['expanded'] / result['seconds'])
+                                           if result['seconds'] else None)
+            del result['moves']
+            yield result
+
+
+def report(results):
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'results': list(results),
+    }
+
+
+def _worse(value, baseline, tolerance, noise):
+    return value is not None and baseline is not None and value > baseline * (1 + tolerance) + noise
+
+
+def compare(current, baseline, tolerance=0.25):
+    """
+    lists (engine, title, what) for each run of the current report that did worse than the same
+    engine on the same level in the baseline report
+    """
+    before = dict(((result['engine'], result['title']), result) for result in baseline['results'])
+    regressions = []
+    for result in current['results']:
+        key = (result['engine'], result['title'])
+        if key not in before:
+            continue
+        old = before[key]
+        if old['status'] == 'solved' and result['status'] != 'solved':
+            regressions.append(key + ("{} rather than solved".format(result['status']),))
+            continue
+        if _worse(result['seconds'], old['seconds'], tolerance, MIN_SECONDS):
+            regressions.append(key + ("{:.3f}s, up from {:.3f}s".format(result['seconds'], old['seconds']),))
+        if _worse(result['peak_rss_kb'], old['peak_rss_kb'], tolerance, MIN_RSS_KB):
+            regressions.append(key + ("peak memory {} KB, up from {} KB".format(result['peak_rss_kb'],
+                                                                               old['peak_rss_kb']),))
+        for field in ('move_count', 'pushes'):
+            if _worse(result[field], old[field], 0, 0):
+                regressions.append(key + ("{} {}, up from {}".format(field, result[field], old[field]),))
+    return regressions
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="sokoban solver benchmarks")
+    parser.add_argument('--levels', default=LEVELS, help="collection of levels to run (default: {})".format(
+        os.path.basename(LEVELS)))
+    parser.add_argument('--engine', action='append', choices=sorted(engines()), dest='engines',
+                        help="engine to run, which can be given more than once (default: all of them)")
+    parser.add_argument('--timeout', type=float, default=60,
+                        help="seconds allowed for each level (default: 60)")
+    parser.add_argument('--memory-mb', type=int,
+                        help="cap on the memory of the process solving each level (default: no limit)")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="number of times to run each level, keeping the fastest (default: 1)")
+    parser.add_argument('--output', help="file for the report (default: standard output)")
+    parser.add_argument('--baseline', help="earlier report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="fraction by which time or memory can grow before it counts as a regression "
+                             "(default: 0.25)")
+    args = parser.parse_args()
+
+    with open(args.levels) as f:
+        levels = list(read_levels(f))
+
+    results = []
+    for result in run(levels, args.engines or sorted(engines()), args.timeout, args.memory_mb, args.repeat):
+        print >>sys.stderr, "{engine:>9} {title:<12} {status:<10} {seconds:>8.3f}s {expanded:>9} states " \
+                            "{peak_rss_kb:>8} KB {move_count} moves".format(**result)
+        results.append(result)
+    current = report(results)
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    json.dump(current, out, indent=1)
+    print >>out
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(current, json.load(f), args.tolerance)
+        for engine, title, what in regressions:
+            print >>sys.stderr, "regression: {} on {}: {}".format(engine, title, what)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
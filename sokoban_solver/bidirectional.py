@@ -0,0 +1,124 @@
+# Bidirectional push-level search for the sokoban solver.
+#
+# A forward breadth-first search of pushes from the start position runs
+# alongside a backward search of pulls from every solved position - all the
+# boxes on targets, with the person in any of the regions left free.  Each
+# round expands a whole layer of whichever side has the smaller frontier, and
+# the search stops at the first layer in which the two sides meet, splicing
+# the pushes of the forward half onto the reversed pulls of the backward half.
+# Each side only has to search about half as deep as a single search would.
+
+from sokoban_solver import OPPOSITE
+from pushsearch import reachable, normalise, pushes, pulls, push, goal_states, push_path, moves_for_pushes
+
+
+def _chain_length(links, key):
+    length = 0
+    while links[key] is not None:
+        key = links[key][0]
+        length += 1
+    return length
+
+
+def _expand_forward(level, frontier, forward, backward, stats, progress):
+    """ expands a layer of pushes, returning (next layer, meeting state closest to a goal, or None) """
+    next_frontier = []
+    meet = None
+    meet_length = None
+    for key in frontier:
+        boxes, region = key
+        stats['expanded'] += 1
+        progress.update(forward, backward)
+        for box_cell, direction, to_cell in pushes(level, boxes, reachable(level, region, boxes), stats):
+            new_boxes = push(level, boxes, box_cell, to_cell)
+            new_key = (new_boxes, normalise(level, box_cell, new_boxes)[0])
+            progress.generated += 1
+            if new_key in forward:
+                continue
+            forward[new_key] = (key, box_cell, direction)
+            next_frontier.append(new_key)
+            if new_key in backward:
+                length = _chain_length(backward, new_key)
+                if meet is None or length < meet_length:
+                    meet, meet_length = new_key, length
+    return next_frontier, meet
+
+
+def _expand_backward(level, frontier, forward, backward, stats, progress):
+    """ expands a layer of pulls, returning (next layer, meeting state closest to the start, or None) """
+    next_frontier = []
+    meet = None
+    meet_length = None
+    for key in frontier:
+        boxes, region = key
+        stats['expanded'] += 1
+        progress.update(forward, backward)
+        for box_cell, direction, to_cell in pulls(level, boxes, reachable(level, region, boxes)):
+            new_boxes = push(level, boxes, box_cell, to_cell)
+            person = level.neighbours[direction][to_cell]
+            new_key = (new_boxes, normalise(level, person, new_boxes)[0])
+            progress.generated += 1
+            if new_key in backward:
+                continue
+            # undoing the pull is pushing the box back from to_cell the other way
+            backward[new_key] = (key, to_cell, OPPOSITE[direction])
+            next_frontier.append(new_key)
+            if new_key in forward:
+                length = _chain_length(forward, new_key)
+                if meet is None or length < meet_length:
+                    meet, meet_length = new_key, length
+    return next_frontier, meet
+
+
+class _Progress(object):
+    """ the two sides' layers and successors so far, passed on to a monitor, if there is one """
+
+    def __init__(self, monitor):
+        self.monitor = monitor
+        self.depth = 0
+        self.frontier = 0
+        self.generated = 0
+
+    def update(self, forward, backward):
+        if self.monitor is not None:
+            self.frontier -= 1
+            self.monitor.update(self.depth, self.frontier, len(forward) + len(backward), self.generated)
+
+
+def solve(state, stats, monitor=None):
+    """
+    bidirectional breadth-first search of pushes and pulls, returning the list of moves of a
+    solution with the fewest pushes, or None if there is no solution, reporting progress to
+    monitor if given, with the depth the sum of the two sides'
+    """
+    level = state.level
+    region, _ = normalise(level, state.person, state.boxes)
+    start = (state.boxes, region)
+
+    # forward maps a state to (parent state, box_cell, direction) of the push which reached it, and
+    # backward maps a state to (next state, box_cell, direction) of the push leading on to a goal
+    forward = {start: None}
+    backward = dict((goal, None) for goal in goal_states(level))
+    forward_frontier = [start]
+    backward_frontier = list(backward)
+    meet = start if start in backward else None
+    progress = _Progress(monitor)
+
+    while meet is None and forward_frontier and backward_frontier:
+        progress.frontier = len(forward_frontier) + len(backward_frontier)
+        if len(forward_frontier) <= len(backward_frontier):
+            forward_frontier, meet = _expand_forward(level, forward_frontier, forward, backward, stats, progress)
+        else:
+            backward_frontier, meet = _expand_backward(level, backward_frontier, forward, backward, stats,
+                                                       progress)
+        progress.depth += 1
+
+    if meet is None:
+        return None
+
+    push_list = push_path(forward, meet)
+    key = meet
+    while backward[key] is not None:
+        key, box_cell, direction = backward[key]
+        push_list.append((box_cell, direction))
+    return moves_for_pushes(state, push_list)
@@ -0,0 +1,127 @@
+# Checkpoints of the sokoban solver's breadth-first search, to resume from.
+#
+# Everything the search keeps is in its StateStore, whose columns are only
+# ever appended to, and which doubles up as the queue, plus a few counters:
+# the index of the next state to expand, the depth and the end of its layer,
+# and the totals so far.  So a checkpoint only has to write the states added
+# since the last one, and the counters, rather than the whole search.  The
+# file is a header identifying the level, followed by a record for each
+# checkpoint of
+#
+#   the number of states in it, the counters, and a CRC-32 of its states
+#   the states' keys, hashes, parent indexes and moves, as in the columns
+#
+# each of which is flushed to disk before the search goes on.  A record cut
+# short by the search being killed while writing it fails its check, and the
+# search is resumed from the one before, the file being cut back to there.
+# The store's hash table is rebuilt from the hash column.
+
+import os
+import struct
+import time
+import zlib
+from array import array
+from statestore import StateStore, WORD_BITS
+
+MAGIC = 'SOKOCKP1'
+# magic, word size, key bits and level digest
+HEADER = struct.Struct('<8sII20s')
+# states, next index, depth, layer end, states generated, expanded, pruned, CRC-32
+RECORD = struct.Struct('<qqqqqqqI')
+
+
+def _columns(store, start, end):
+    """ the store's columns for states start to end, as arrays """
+    words = store.words
+    return (store.keys[start * words:end * words], store.hashes[start:end],
+            store.parents[start:end], store.moves[start:end])
+
+
+def _crc(columns):
+    crc = 0
+    for column in columns:
+        crc = zlib.crc32(column.tostring(), crc)
+    return crc & 0xffffffff
+
+
+class Checkpoint(object):
+    """ checkpoints, at path, of a breadth-first search of level, written at most every interval seconds """
+
+    def __init__(self, path, level, interval=60.0):
+        self.path = path
+        self.level = level
+        self.interval = interval
+        self.last_time = time.time()
+        self.written = 0
+        self.f = None
+
+    def restore(self, stats):
+        """
+        (store, next index, depth, layer end, states generated) as of the last checkpoint in the
+        file, adding its totals to stats, or None if there is no file or no checkpoint in it
+        """
+        if not os.path.exists(self.path):
+            return None
+        level = self.level
+        f = open(self.path, 'r+b')
+        magic, word_bits, key_bits, digest = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise Exception("{} is not a checkpoint".format(self.path))
+        if word_bits != WORD_BITS or key_bits != level.key_bits() or digest != level.digest():
+            raise Exception("checkpoint {} is of a different level, or from a different machine".format(self.path))
+
+        store = StateStore(key_bits)
+        counters = None
+        good = f.tell()
+        while True:
+            record = f.read(RECORD.size)
+            if len(record) < RECORD.size:
+                break
+            count, index, depth, layer_end, generated, expanded, pruned, crc = RECORD.unpack(record)
+            columns = (array('L'), array('l'), array('l'), array('c'))
+            try:
+                for column, length in zip(columns, (count * store.words, count, count, count)):
+                    column.fromfile(f, length)
+            except EOFError:
+                break
+            if _crc(columns) != crc:
+                break
+            for stored, column in zip((store.keys, store.hashes, store.parents, store.moves), columns):
+                stored.extend(column)
+            counters = (index, depth, layer_end, generated, expanded, pruned)
+            good = f.tell()
+
+        # anything after the last good record is dropped, and later records follow on from it
+        f.seek(good)
+        f.truncate()
+        self.f = f
+        if counters is None:
+            return None
+        self.written = len(store)
+        store.rebuild()
+        index, depth, layer_end, generated, expanded, pruned = counters
+        stats['expanded'] += expanded
+        stats['pruned'] += pruned
+        return store, index, depth, layer_end, generated
+
+    def due(self):
+        return time.time() - self.last_time >= self.interval
+
+    def save(self, store, index, depth, layer_end, generated, stats):
+        """ writes the states added to store since the last checkpoint, and the counters, to the file """
+        if self.f is None:
+            self.f = open(self.path, 'wb')
+            self.f.write(HEADER.pack(MAGIC, WORD_BITS, self.level.key_bits(), self.level.digest()))
+        columns = _columns(store, self.written, len(store))
+        self.f.write(RECORD.pack(len(store) - self.written, index, depth, layer_end, generated,
+                                 stats['expanded'], stats['pruned'], _crc(columns)))
+        for column in columns:
+            column.tofile(self.f)
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.written = len(store)
+        self.last_time = time.time()
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+
+# A long-running solver service for the sokoban solver.
+#
+# The daemon listens on a Unix socket, or a port on localhost, for requests
+# of one line of JSON each, and answers each with a line of JSON.  A request
+# holds a level, in either notation that read_levels() takes, and optionally
+# the engine and its options:
+#
+# {"level": "#####\n#@$.#\n#####\n", "engine": "astar", "options": {"prune": true}}
+#
+# and the answer is the same as batch.py's result for the level, less its
+# number and title, and saying whether the solution came from the cache:
+#
+# {"status": "solved", "moves": "R", "move_count": 1, "pushes": 1, "expanded": 2,
+#  "seconds": 0.001, "peak_rss_kb": 9012, "cached": false}
+#
+# Searches run in a set of worker processes, each of which keeps the Levels
+# it has seen, with their precomputed tables (dead squares, push distances and
+# so on), for the next request for the same walls and targets.  To make use of
+# them, each level is always sent to the same worker, chosen by its walls and
+# targets, and a worker solves one level at a time.  Solutions are kept in
+# memory too, by the canonical key of solutioncache and the engine and its
+# options, so that a level asked for again, even turned round, is answered
+# without a search.  Both are evicted least recently used first.
+# Connections are each handled in a thread of their own, and can send any
+# number of requests.  The parallel engine can't be used, as the workers
+# can't start processes of their own.
+#
+# A request can give a "timeout" in seconds, and the daemon can have a limit
+# of its own, the lesser of which applies.  A search that runs past it has
+# its worker killed, and replaced with a new one, and is answered with a
+# status of timeout, so that a hard level can't hold a worker for ever.
+#
+# Only the options in OPTIONS can be given.  None of them name a file, so that
+# a client can't have the daemon read or write files of its choosing (the
+# checkpoint, workdir and patterns options are left out for that reason).
+
+import collections
+import json
+import multiprocessing
+import resource
+import socket
+import SocketServer
+import threading
+import time
+from StringIO import StringIO
+import solutioncache
+from sokoban_solver import BoardState, Level, count_pushes, engines, read_levels
+
+# the options a request can give each engine, and the types of their values
+NUMBER = (int, long, float)
+OPTIONS = {
+    'bfs': {},
+    'push': {},
+    'astar': {'prune': bool},
+    'idastar': {'prune': bool, 'table_mb': NUMBER},
+    'bidir': {},
+    'external': {'window': (int, long)},
+    'anytime': {'time_budget': NUMBER, 'prune': bool},
+    'vectorized': {},
+}
+
+
+def check_options(engine, options):
+    """ raises an exception unless options are a dict of options the engine may be given """
+    if engine not in OPTIONS:
+        raise Exception("unknown engine '{}'".format(engine))
+    if not isinstance(options, dict):
+        raise Exception("options must be an object")
+    allowed = OPTIONS[engine]
+    for name, value in options.items():
+        if name not in allowed:
+            raise Exception("option '{}' can't be given to engine '{}'".format(name, engine))
+        # bools are ints too, and null means the engine's default
+        if value is not None and (not isinstance(value, allowed[name]) or
+                                  (isinstance(value, bool) and allowed[name] is not bool)):
+            raise Exception("option '{}' has a value of the wrong type".format(name))
+
+
+# the worker's Levels, by walls and targets, most recently used last
+_levels = collections.OrderedDict()
+_level_cache_size = 64
+
+
+def _warm_level(board, target_locations):
+    """ the worker's Level for the walls and targets, built the first time it is asked for """
+    key = (board, target_locations)
+    level = _levels.pop(key, None)
+    if level is None:
+        level = Level(board, target_locations)
+    _levels[key] = level
+    while len(_levels) > _level_cache_size:
+        _levels.popitem(last=False)
+    return level
+
+
+def _solve(board, target_locations, person, boxes, engine, options):
+    """ runs in a worker, returning (status, moves, expanded, seconds, peak_rss_kb, error) """
+    stats = collections.Counter()
+    start = time.time()
+    error = None
+    try:
+        state = BoardState(_warm_level(board, target_locations), person, boxes)
+        moves = engines()[engine](state, stats, **options)
+        status = 'unsolvable' if moves is None else 'solved'
+    except Exception as e:
+        moves = None
+        status = 'error'
+        error = '{}: {}'.format(type(e).__name__, e)
+    return (status, moves, stats['expanded'], time.time() - start,
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, error)
+
+
+def _work(conn, level_cache_size):
+    """ a worker process's loop, solving each level sent to it in turn """
+    global _level_cache_size
+    _level_cache_size = level_cache_size
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        conn.send(_solve(*request))
+
+
+class Worker(object):
+    """ a worker process, solving one level at a time """
+
+    def __init__(self, level_cache_size):
+        self.level_cache_size = level_cache_size
+        self.lock = threading.Lock()
+        self.start()
+
+    def start(self):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_work, args=(child_conn, self.level_cache_size))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+
+    def stop(self):
+        self.conn.close()
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+
+    def solve(self, request, timeout=None):
+        """
+        the outcome of _solve(*request), as (status, moves, expanded, seconds, peak_rss_kb, error),
+        giving up after timeout seconds, if given, and starting a new process in place of this one
+        """
+        with self.lock:
+            start = time.time()
+            self.conn.send(request)
+            if self.conn.poll(timeout):
+                try:
+                    return self.conn.recv()
+                except EOFError:
+                    pass
+                status, error = 'error', "worker died"
+            else:
+                status, error = 'timeout', None
+            self.stop()
+            self.start()
+            return status, None, 0, time.time() - start, None, error
+
+
+class SolutionMemo(object):
+    """ solutions by canonical level and search, in memory, keeping the size most recently used """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = collections.OrderedDict()
+
+    def get(self, state, search):
+        """ the list of moves solving state's level with search, a string naming the engine and options, or None """
+        key, directions = solutioncache.canonical(state)
+        stored = self.entries.pop((key, search), None)
+        if stored is None:
+            return None
+        self.entries[(key, search)] = stored
+        back = dict((m, d) for d, m in directions.items())
+        return [back[m] for m in stored]
+
+    def put(self, state, search, moves):
+        key, directions = solutioncache.canonical(state)
+        self.entries.pop((key, search), None)
+        self.entries[(key, search)] = ''.join(directions[d] for d in moves)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+class Solver(object):
+    """
+    answers requests, with processes worker processes (by default one per cpu), a memo of solutions,
+    and searches given up on after timeout seconds, if given, or less if a request asks for it
+    """
+
+    def __init__(self, processes=None, level_cache_size=64, solution_cache_size=1024, timeout=None):
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.workers = [Worker(level_cache_size) for _ in xrange(processes)]
+        self.memo = SolutionMemo(solution_cache_size)
+        self.lock = threading.Lock()
+        self.timeout = timeout
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+
+    def worker(self, level):
+        """ the worker which solves levels with level's walls and targets """
+        return self.workers[hash((level.board, level.target_locations)) % len(self.workers)]
+
+    def answer(self, request):
+        """ the answer, as a dict, to a request, as a dict """
+        try:
+            levels = list(read_levels(StringIO(request['level'])))
+            if len(levels) != 1:
+                raise Exception("expected one level, found {}".format(len(levels)))
+            state = levels[0][1]
+            engine = request.get('engine', 'bfs')
+            options = request.get('options', {})
+            check_options(engine, options)
+            search = solutioncache.search_key(engine, **options)
+            timeout = request.get('timeout', self.timeout)
+            if timeout is not None:
+                if not isinstance(timeout, NUMBER) or isinstance(timeout, bool) or timeout <= 0:
+                    raise Exception("timeout must be a number of seconds")
+                if self.timeout is not None:
+                    timeout = min(timeout, self.timeout)
+        except Exception as e:
+            return {'status': 'error', 'error': '{}: {}'.format(type(e).__name__, e)}
+
+        with self.lock:
+            moves = self.memo.get(state, search)
+        if moves is not None:
+            status, expanded, seconds, peak_rss_kb, error = 'solved', 0, 0, None, None
+            cached = True
+        else:
+            level = state.level
+            status, moves, expanded, seconds, peak_rss_kb, error = self.worker(level).solve((
+                level.board, level.target_locations, state.person, state.boxes, engine, options), timeout)
+            cached = False
+            if moves is not None:
+                with self.lock:
+                    self.memo.put(state, search, moves)
+
+        answer = collections.OrderedDict()
+        answer['status'] = status
+        answer['moves'] = ''.join(moves) if moves is not None else None
+        answer['move_count'] = len(moves) if moves is not None else None
+        answer['pushes'] = count_pushes(state, moves) if moves is not None else None
+        answer['expanded'] = expanded
+        answer['seconds'] = round(seconds, 3)
+        answer['peak_rss_kb'] = peak_rss_kb
+        answer['cached'] = cached
+        if status == 'error':
+            answer['error'] = error
+        return answer
+
+
+class Handler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        for line in iter(self.rfile.readline, ''):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                answer = {'status': 'error', 'error': 'bad request: {}'.format(e)}
+            else:
+                answer = self.server.solver.answer(request)
+            self.wfile.write(json.dumps(answer) + '\n')
+            self.wfile.flush()
+
+
+class UnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+class TCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(address, solver):
+    """ a server answering requests with solver on address, a socket path or a (host, port) pair """
+    server_class = UnixServer if isinstance(address, basestring) else TCPServer
+    server = server_class(address, Handler)
+    server.solver = solver
+    return server
+
+
+def ask(address, level, engine='bfs', timeout=None, **options):
+    """
+    sends a request for level, the text of one, to the daemon at address, to be solved within timeout
+    seconds if given, returning the answer
+    """
+    family = socket.AF_UNIX if isinstance(address, basestring) else socket.AF_INET
+    connection = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        connection.connect(address)
+        f = connection.makefile('r+')
+        request = {'level': level, 'engine': engine, 'options': options}
+        if timeout is not None:
+            request['timeout'] = timeout
+        f.write(json.dumps(request) + '\n')
+        f.flush()
+        return json.loads(f.readline())
+    finally:
+        connection.close()
+
+
+def main():
+    import os, sys, argparse
+
+    parser = argparse.ArgumentParser(description="sokoban solver daemon")
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument('--socket', help="path of the Unix socket to listen on")
+    where.add_argument('--port', type=int, help="port to listen on, on localhost")
+    parser.add_argument('--processes', type=int,
+                        help="number of worker processes (default: one per cpu)")
+    parser.add_argument('--level-cache', type=int, default=64,
+                        help="number of levels each worker keeps precomputed tables for (default: 64)")
+    parser.add_argument('--solution-cache', type=int, default=1024,
+                        help="number of solutions kept in memory (default: 1024)")
+    parser.add_argument('--timeout', type=float,
+                        help="seconds a search may take before its worker is killed, and which requests can "
+                             "only ask for less of (default: as long as a request asks for, or no limit)")
+    args = parser.parse_args()
+
+    if args.socket and os.path.exists(args.socket):
+        os.remove(args.socket)
+    address = args.socket or ('127.0.0.1', args.port)
+
+    solver = Solver(args.processes, args.level_cache, args.solution_cache, args.timeout)
+    server = serve(address, solver)
+    print >>sys.stderr, "listening on {}".format(address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        solver.close()
+        if args.socket:
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
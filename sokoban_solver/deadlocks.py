@@ -0,0 +1,83 @@
+# Deadlock detection for the sokoban solver.
+#
+# A push is pruned when it leaves the level unsolvable, either because the box
+# lands on a dead square - one from which no target can ever be reached, which
+# is worked out once per level - or because it freezes the box in place along
+# with its neighbours while some of them are not on targets.
+
+from sokoban_solver import DIRECTIONS
+
+AXES = (('L', 'R'), ('U', 'D'))
+
+
+def dead_squares(level):
+    """
+    bitmask of the cells from which a box can never be pushed onto a target, found by pulling
+    a box backwards from every target: to pull a box onto a cell, the person has to be able to
+    step on beyond the cell it is pulled to
+    """
+    live = bytearray(len(level.cells))
+    frontier = level.indexes(level.targets)
+    for cell in frontier:
+        live[cell] = 1
+    while frontier:
+        cell = frontier.pop()
+        for direction in DIRECTIONS:
+            neighbours = level.neighbours[direction]
+            from_cell = neighbours[cell]
+            if from_cell is None or live[from_cell] or neighbours[from_cell] is None:
+                continue
+            live[from_cell] = 1
+            frontier.append(from_cell)
+
+    dead = 0
+    for cell, bit in enumerate(level.bits):
+        if not live[cell]:
+            dead |= bit
+    return dead
+
+
+def _blocked(level, dead, group, cell, axis):
+    """ can the box on cell no longer be usefully pushed along axis, while the boxes in group stay put? """
+    first = level.neighbours[axis[0]][cell]
+    second = level.neighbours[axis[1]][cell]
+    if first is None or second is None or first in group or second in group:
+        # the person can't stand on that side to push it the other way
+        return True
+    bits = level.bits
+    return bool(dead & bits[first] and dead & bits[second])
+
+
+def is_deadlock(level, boxes, to_cell):
+    """
+    Has pushing a box onto to_cell, giving boxes, left the level unsolvable?  Either to_cell is a
+    dead square, or the box is now frozen along with a group of boxes around it, not all of which
+    are on targets.
+    """
+    dead = level.precomputed('dead_squares', dead_squares)
+    bits = level.bits
+    if dead & bits[to_cell]:
+        return True
+
+    # the boxes touching the pushed box, directly or through each other
+    group = set([to_cell])
+    stack = [to_cell]
+    while stack:
+        cell = stack.pop()
+        for neighbour in level.adjacent[cell]:
+            if boxes & bits[neighbour] and neighbour not in group:
+                group.add(neighbour)
+                stack.append(neighbour)
+
+    # keep dropping boxes which could still move if the rest stayed put, until only frozen ones are left
+    changed = True
+    while changed:
+        changed = False
+        for cell in list(group):
+            if not (_blocked(level, dead, group, cell, AXES[0]) and _blocked(level, dead, group, cell, AXES[1])):
+                group.discard(cell)
+                changed = True
+        if to_cell not in group:
+            return False
+
+    return any(not level.targets & bits[cell] for cell in group)
@@ -0,0 +1,206 @@
+# External-memory breadth-first search for the sokoban solver.
+#
+# The same step-by-step search as solve_bfs(), but with each depth layer kept
+# in a file of fixed-width state records (see Level.encode), big-endian so
+# that they sort as bytes in numeric order, and read back through mmap.
+#
+# Duplicate detection is delayed: the successors of a layer are gathered in
+# bounded chunks, each sorted and written out as a run, and the runs are then
+# merged together and against the earlier layers, which are sorted too, to
+# write the next layer.  No parent links are kept - once a solved state is
+# found, its moves are worked out by a backward pass over the stored layers,
+# looking for a state in each that leads to the one found in the next.
+#
+# A breadth-first search of an undirected graph only needs to check the last
+# two layers for duplicates.  Walking about is reversible, but pushing isn't,
+# so a sokoban position can come round again many layers later, and by
+# default every state seen is checked, so that the search finishes on
+# unsolvable levels.  They're kept in one more sorted file, of every layer so
+# far, which each new layer is merged into, through a temporary file renamed
+# over it - so the search reads through one file, not one per layer, however
+# deep it goes.  A window of the last few layers can be given instead,
+# trading re-expanded states for less reading.
+
+import binascii
+import heapq
+import mmap
+import os
+import shutil
+import tempfile
+from sokoban_solver import BoardState, step_successors
+
+
+class LayerFile(object):
+    """ a sorted file of fixed-width records, read through mmap """
+
+    def __init__(self, path, width):
+        self.path = path
+        self.width = width
+
+    def __len__(self):
+        return os.path.getsize(self.path) // self.width
+
+    def __iter__(self):
+        width = self.width
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for offset in xrange(0, len(data), width):
+                    yield data[offset:offset + width]
+            finally:
+                data.close()
+
+
+def _write(path, records):
+    with open(path, 'wb') as f:
+        for record in records:
+            f.write(record)
+
+
+def _unique(records):
+    """ drops repeats from sorted records """
+    last = None
+    for record in records:
+        if record != last:
+            yield record
+            last = record
+
+
+def _without(records, seen):
+    """ the sorted records which are not in the sorted records of seen """
+    seen = iter(seen)
+    other = next(seen, None)
+    for record in records:
+        while other is not None and other < record:
+            other = next(seen, None)
+        if record != other:
+            yield record
+
+
+class ExternalSearch(object):
+
+    def __init__(self, state, stats, workdir, window, chunk, monitor=None):
+        self.level = state.level
+        self.stats = stats
+        self.monitor = monitor
+        self.generated = 0
+        self.workdir = workdir
+        self.window = window
+        self.chunk = chunk
+        self.width = (self.level.key_bits() + 7) // 8
+        self.layers = []
+        # every layer so far, when there's no window
+        self.visited = None
+
+    def record(self, person, boxes):
+        return binascii.unhexlify('%0*x' % (2 * self.width, self.level.encode(person, boxes)))
+
+    def state(self, record):
+        return BoardState(self.level, *self.level.decode(int(binascii.hexlify(record), 16)))
+
+    def successors(self, s, count=True):
+        """ (direction, state) for each move from s which doesn't deadlock the level, counting those that do if count """
+        return step_successors(s, self.stats if count else None)
+
+    def path(self, name):
+        return os.path.join(self.workdir, name)
+
+    def expand(self, layer):
+        """ writes out the next layer after layer, returning it, or returns the solved record in layer """
+        runs = []
+        buffer = []
+        monitor = self.monitor
+        if monitor is not None:
+            depth = len(self.layers) - 1
+            frontier = len(layer)
+            visited = (len(self.visited) if self.visited is not None
+                       else sum(len(earlier) for earlier in self.layers))
+        for record in layer:
+            s = self.state(record)
+            self.stats['expanded'] += 1
+            if monitor is not None:
+                frontier -= 1
+                monitor.update(depth, frontier, visited, self.generated)
+            if s.is_solved():
+                return record
+            for _, new_s in self.successors(s):
+                self.generated += 1
+                buffer.append(self.record(new_s.person, new_s.boxes))
+            if len(buffer) >= self.chunk:
+                runs.append(self.write_run(buffer, len(runs)))
+                buffer = []
+        if buffer or not runs:
+            runs.append(self.write_run(buffer, len(runs)))
+
+        if self.window:
+            seen = _unique(heapq.merge(*self.layers[-self.window:]))
+        else:
+            seen = self.visited
+        records = _without(_unique(heapq.merge(*runs)), seen)
+        next_layer = LayerFile(self.path('layer-{:06d}'.format(len(self.layers))), self.width)
+        _write(next_layer.path, records)
+        for run in runs:
+            os.remove(run.path)
+        if self.visited is not None:
+            self.add_visited(next_layer)
+        return next_layer
+
+    def add_visited(self, layer):
+        """ merges layer, none of whose records are in it already, into the visited file """
+        path = self.path('visited.tmp')
+        _write(path, heapq.merge(self.visited, layer))
+        os.rename(path, self.visited.path)
+
+    def write_run(self, buffer, number):
+        buffer.sort()
+        run = LayerFile(self.path('run-{:06d}'.format(number)), self.width)
+        _write(run.path, _unique(buffer))
+        return run
+
+    def moves_to(self, record):
+        """ the moves to the state of record in the last layer, by a backward pass over the layers """
+        target = self.state(record)
+        moves = []
+        for layer in reversed(self.layers[:-1]):
+            for earlier in layer:
+                s = self.state(earlier)
+                found = [direction for direction, new_s in self.successors(s, count=False) if new_s == target]
+                if found:
+                    moves.append(found[0])
+                    target = s
+                    break
+            else:
+                raise Exception("no parent found for a state in the layer after {}".format(layer.path))
+        moves.reverse()
+        return moves
+
+    def solve(self, state):
+        first = LayerFile(self.path('layer-000000'), self.width)
+        _write(first.path, [self.record(state.person, state.boxes)])
+        self.layers.append(first)
+        if not self.window:
+            self.visited = LayerFile(self.path('visited'), self.width)
+            shutil.copyfile(first.path, self.visited.path)
+        while len(self.layers[-1]):
+            result = self.expand(self.layers[-1])
+            if not isinstance(result, LayerFile):
+                return self.moves_to(result)
+            self.layers.append(result)
+        return None
+
+
+def solve(state, stats, workdir=None, window=0, chunk=1 << 20, monitor=None):
+    """
+    breadth-first search of board states, one person step at a time, with the layers of the search
+    kept on disk in workdir (by default the system temporary directory), returning the list of moves,
+    or None if there is no solution.  Successors are checked against the last window layers, or every
+    state seen if window is 0, and sorted in memory chunk states at a time.  Progress is reported to
+    monitor if given, with the states in the layers so far counted as seen.
+    """
+    workdir = tempfile.mkdtemp(prefix='sokoban-', dir=workdir)
+    try:
+        return ExternalSearch(state, stats, workdir, window, chunk, monitor).solve(state)
+    finally:
+        shutil.rmtree(workdir)
@@ -0,0 +1,102 @@
+# Lower bounds on the number of pushes still needed to solve a position,
+# for the informed search engines.
+
+from sokoban_solver import DIRECTIONS, OPPOSITE
+
+# distance used for a box which can never be pushed to a target
+UNREACHABLE = 1000000
+
+
+def push_distances(level):
+    """
+    For each target (in ascending cell order), a list of the fewest pushes needed to get a
+    box from each cell onto that target, ignoring all other boxes, worked out by pulling a box
+    backwards from the target.  Cells from which the target can't be reached are UNREACHABLE.
+    """
+    tables = []
+    for target in level.indexes(level.targets):
+        distance = [UNREACHABLE] * len(level.cells)
+        distance[target] = 0
+        frontier = [target]
+        while frontier:
+            next_frontier = []
+            for cell in frontier:
+                for direction in DIRECTIONS:
+                    # a push in direction onto cell needs the box before it, and the person behind that
+                    back = level.neighbours[OPPOSITE[direction]]
+                    from_cell = back[cell]
+                    if from_cell is None or back[from_cell] is None:
+                        continue
+                    if distance[from_cell] == UNREACHABLE:
+                        distance[from_cell] = distance[cell] + 1
+                        next_frontier.append(from_cell)
+            frontier = next_frontier
+        tables.append(distance)
+    return tables
+
+
+def min_cost_matching(cost):
+    """
+    Total cost of the cheapest assignment of rows to distinct columns, for a cost matrix with
+    no more rows than columns, by the Hungarian algorithm.
+    """
+    rows = len(cost)
+    columns = len(cost[0]) if rows else 0
+    infinity = float('inf')
+    u = [0] * (rows + 1)
+    v = [0] * (columns + 1)
+    matched_row = [0] * (columns + 1)
+    way = [0] * (columns + 1)
+    for row in xrange(1, rows + 1):
+        matched_row[0] = row
+        column = 0
+        min_v = [infinity] * (columns + 1)
+        used = [False] * (columns + 1)
+        while True:
+            used[column] = True
+            r = matched_row[column]
+            delta = infinity
+            next_column = 0
+            cost_row = cost[r - 1]
+            for j in xrange(1, columns + 1):
+                if not used[j]:
+                    reduced = cost_row[j - 1] - u[r] - v[j]
+                    if reduced < min_v[j]:
+                        min_v[j] = reduced
+                        way[j] = column
+                    if min_v[j] < delta:
+                        delta = min_v[j]
+                        next_column = j
+            for j in xrange(columns + 1):
+                if used[j]:
+                    u[matched_row[j]] += delta
+                    v[j] -= delta
+                else:
+                    min_v[j] -= delta
+            column = next_column
+            if matched_row[column] == 0:
+                break
+        while column:
+            previous = way[column]
+            matched_row[column] = matched_row[previous]
+            column = previous
+    return -v[0]
+
+
+def matching_lower_bound(level, boxes):
+    """
+    The fewest pushes needed to get every box onto its own target, each box moving alone,
+    which is an admissible (and consistent) estimate of the pushes left to solve the boxes.
+    Returns None if some box can never be matched to a target.
+    """
+    distances = level.precomputed('push_distances', push_distances)
+    cost = []
+    for box in level.indexes(boxes):
+        row = [distance[box] for distance in distances]
+        if min(row) == UNREACHABLE:
+            return None
+        cost.append(row)
+    total = min_cost_matching(cost)
+    if total >= UNREACHABLE:
+        return None
+    return total
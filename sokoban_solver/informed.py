@@ -0,0 +1,246 @@
+# Informed search engines for the sokoban solver, A* and IDA*, over the same
+# push-level states as pushsearch.  Both are guided by the box-to-target
+# matching lower bound in heuristics, which is consistent, so both return
+# solutions with the fewest pushes.  Either can prune the pushes it tries with
+# tunnel macros and PI-corrals - see pruning - and be given a pattern database
+# for a tighter bound - see patterns.
+
+import collections
+import heapq
+import itertools
+import pruning
+import transposition
+from sokoban_solver import OPPOSITE
+from pushsearch import reachable, normalise, pushes, push, push_path, moves_for_pushes
+from patterns import lower_bound
+
+
+def box_count(mask):
+    return bin(mask).count('1')
+
+
+def successors(level, boxes, region, stats, prune):
+    """ (box_cell, direction, to_cell, number of pushes) for each push to try from the state """
+    reached = reachable(level, region, boxes)
+    if prune:
+        return pruning.pruned_pushes(level, boxes, reached, stats)
+    return ((box_cell, direction, to_cell, 1)
+            for box_cell, direction, to_cell in pushes(level, boxes, reached, stats))
+
+
+def _least(a, b):
+    """ the lesser of a and b, either of which may be None for none """
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
+
+
+def solve_astar(state, stats, monitor=None, prune=False, patterns=None):
+    """
+    A* search of pushes, returning the list of moves of a solution with the fewest pushes, or None,
+    reporting progress to monitor if given, pruning the pushes tried if prune is set, and guided by
+    the pattern database patterns if given
+    """
+    level = state.level
+    if box_count(state.boxes) != box_count(level.targets):
+        return None
+    h = lower_bound(level, state.boxes, patterns)
+    if h is None:
+        return None
+
+    region, _ = normalise(level, state.person, state.boxes)
+    start = (state.boxes, region)
+    best_g = {start: 0}
+    parent = {start: None}
+
+    # entries are (f, -g, tie-break, state), so that of equal f the deepest is expanded first
+    counter = itertools.count()
+    open_list = [(h, 0, next(counter), start)]
+    solution = None
+    generated = 0
+
+    while open_list:
+        _, neg_g, _, key = heapq.heappop(open_list)
+        g = -neg_g
+        if g > best_g[key]:
+            # superseded by a cheaper route to the same state
+            continue
+        boxes, region = key
+        stats['expanded'] += 1
+        if monitor is not None:
+            monitor.update(g, len(open_list), len(best_g), generated)
+        if boxes == level.targets:
+            solution = key
+            break
+        for box_cell, direction, to_cell, count in successors(level, boxes, region, stats, prune):
+            new_boxes = push(level, boxes, box_cell, to_cell)
+            person = level.neighbours[OPPOSITE[direction]][to_cell]
+            new_key = (new_boxes, normalise(level, person, new_boxes)[0])
+            new_g = g + count
+            generated += 1
+            if new_key in best_g and best_g[new_key] <= new_g:
+                continue
+            best_g[new_key] = new_g
+            h = lower_bound(level, new_boxes, patterns)
+            if h is None:
+                continue
+            parent[new_key] = (key, box_cell, direction, to_cell)
+            heapq.heappush(open_list, (new_g + h, -new_g, next(counter), new_key))
+
+    if solution is None:
+        return None
+    return moves_for_pushes(state, push_path(parent, solution))
+
+
+def _exhausted(level, boxes, region, stats, prune, patterns, limit):
+    """
+    True if a search of every state reached from (boxes, region), up to limit of them, finds that
+    none of them is solved
+    """
+    start = (boxes, region)
+    seen = set([start])
+    stack = [start]
+    # the IDA* search has counted the pushes pruned already
+    scratch = collections.Counter()
+    while stack:
+        boxes, region = stack.pop()
+        stats['expanded'] += 1
+        if boxes == level.targets:
+            return False
+        for box_cell, direction, to_cell, _ in successors(level, boxes, region, scratch, prune):
+            new_boxes = push(level, boxes, box_cell, to_cell)
+            if lower_bound(level, new_boxes, patterns) is None:
+                continue
+            new_key = (new_boxes, normalise(level, level.neighbours[OPPOSITE[direction]][to_cell], new_boxes)[0])
+            if new_key not in seen:
+                if len(seen) == limit:
+                    return False
+                seen.add(new_key)
+                stack.append(new_key)
+    return True
+
+
+# megabytes of transposition table IDA* has by default
+TABLE_MB = 16
+
+
+def solve_idastar(state, stats, monitor=None, prune=False, patterns=None, table_mb=TABLE_MB):
+    """
+    IDA* search of pushes, returning the list of moves of a solution with the fewest pushes, or None.
+    Only the current path is kept in memory, at the cost of re-expanding states on each iteration.
+    Progress is reported to monitor if given, with no states counted as seen but those on the path,
+    the pushes tried are pruned if prune is set, and the pattern database patterns, if given, guides it.
+    A transposition table of table_mb megabytes cuts down the re-expansions, and shows when there may be
+    no solution: once an iteration has come across nothing but states already in the table, they're all
+    searched through, up to as many as the table holds, to see.  With a table_mb of 0 or None there's
+    no table, and on a level with no solution the search may not end for a very long time.
+    """
+    level = state.level
+    if box_count(state.boxes) != box_count(level.targets):
+        return None
+    h = lower_bound(level, state.boxes, patterns)
+    if h is None:
+        return None
+
+    table = None
+    if table_mb:
+        table = transposition.TranspositionTable(level.key_bits(), int(table_mb * 1024 * 1024))
+
+    region, _ = normalise(level, state.person, state.boxes)
+    path = []
+    on_path = set([(state.boxes, region)])
+    # whether the iteration has come across a state that wasn't in the table
+    unseen = [False]
+
+    def search(boxes, region, g, h, bound, iteration):
+        """
+        True once solved, otherwise (the smallest f beyond bound seen, or None if there was none,
+        and the least f a solution through the state could have, or None if there's no solution)
+        """
+        key = None
+        if table is not None:
+            key = level.encode(region, boxes)
+            entry = table.get(key)
+            if entry is None:
+                unseen[0] = True
+            else:
+                stored_g, known, beyond, age = entry
+                if known == transposition.DEAD:
+                    return None, None
+                if age == iteration and stored_g <= g:
+                    # searched already this iteration, with at least as many pushes to spare
+                    return None if beyond == transposition.NOTHING else g + beyond, g + known
+        stats['expanded'] += 1
+        if monitor is not None:
+            monitor.update(g, 0, len(on_path), 0)
+        if boxes == level.targets:
+            return True
+        children = []
+        # pushes back onto the path aren't searched, but a solution could still go that way
+        least = None
+        for box_cell, direction, to_cell, count in successors(level, boxes, region, stats, prune):
+            new_boxes = push(level, boxes, box_cell, to_cell)
+            new_region = normalise(level, level.neighbours[OPPOSITE[direction]][to_cell], new_boxes)[0]
+            new_h = lower_bound(level, new_boxes, patterns)
+            if new_h is None:
+                continue
+            if table is not None:
+                entry = table.get(level.encode(new_region, new_boxes))
+                if entry is None:
+                    unseen[0] = True
+                else:
+                    if entry[1] == transposition.DEAD:
+                        continue
+                    new_h = max(new_h, entry[1])
+            if (new_boxes, new_region) in on_path:
+                least = _least(least, g + count + new_h)
+                continue
+            children.append((count + new_h, count, new_h, box_cell, direction, to_cell, new_boxes, new_region))
+        children.sort()
+
+        smallest = None
+        for cost, count, new_h, box_cell, direction, to_cell, new_boxes, new_region in children:
+            f = child_least = g + cost
+            if f <= bound:
+                child = (new_boxes, new_region)
+                on_path.add(child)
+                path.append((box_cell, direction, to_cell))
+                result = search(new_boxes, new_region, g + count, new_h, bound, iteration)
+                if result is True:
+                    return True
+                f, child_least = result
+                path.pop()
+                on_path.discard(child)
+            smallest = _least(smallest, f)
+            least = _least(least, child_least)
+
+        if table is not None:
+            table.put(key, g, transposition.DEAD if least is None else max(h, least - g),
+                      transposition.NOTHING if smallest is None else smallest - g, iteration)
+        return smallest, least
+
+    bound = h
+    iteration = 0
+    # whether every state has been searched through since the table last took in a new one
+    exhausted = False
+    while True:
+        stats['iterations'] += 1
+        iteration += 1
+        unseen[0] = False
+        result = search(state.boxes, region, 0, h, bound, iteration)
+        if result is True:
+            return moves_for_pushes(state, path)
+        if result[0] is None:
+            return None
+        if table is not None and not unseen[0] and not exhausted:
+            # raising the bound has turned up nothing new, which on a level with no solution it never
+            # will.  The learned bounds of states which only lead round in circles keep on rising, so
+            # IDA* itself would go on for ever: search through every state to see if that's so.
+            if _exhausted(level, state.boxes, region, stats, prune, patterns, len(table)):
+                return None
+            exhausted = True
+        elif unseen[0]:
+            exhausted = False
+        bound = result[0]
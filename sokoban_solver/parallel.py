@@ -0,0 +1,209 @@
+# Multi-core breadth-first search for the sokoban solver.
+#
+# The same step-by-step search as solve_bfs(), expanded a whole depth layer at
+# a time across a set of worker processes.  Each state is owned by the worker
+# chosen by its Zobrist hash (the tables for which are seeded from the level,
+# so every process hashes a state alike).  A worker keeps its shard of the
+# visited set and parent links in a StateStore of its own, with each parent
+# given as its index in its owner's store times the number of workers, plus
+# the owner.  For each layer:
+#
+#  - every worker expands the states it owns, tagging each successor with its
+#    parent's rank in the layer and the direction.  Successors it owns itself
+#    go straight into its store, and the rest are sent straight to the worker
+#    owning them, in columns of arrays, on that worker's queue
+#  - each worker adds the successors sent to it which it hasn't seen before,
+#    keeping the first occurrence, in tag order, of each state new in the
+#    layer, and tells the coordinator which tags it kept
+#  - the coordinator merges the accepted tags to rank the next layer, and
+#    sends each worker the ranks of its states, starting the next layer
+#
+# So each successor is pickled at most once, and the coordinator only handles
+# the tags.  The tags order successors just as the serial queue would have, so
+# the first solved state found, and the parent links leading to it, are the
+# same as for solve_bfs().
+
+import collections
+import heapq
+import multiprocessing
+import resource
+from array import array
+from sokoban_solver import DIRECTIONS, Level, BoardState, step_successors
+from statestore import StateStore, EMPTY
+
+# the order of each direction among a state's successors, for their tags
+ORDER = dict((direction, i) for i, direction in enumerate(DIRECTIONS))
+
+
+def _worker(conn, queues, number, board, target_locations):
+    level = Level(board, target_locations)
+    workers = len(queues)
+    store = StateStore(level.key_bits())
+    # the indexes in store of the states of the next layer, in tag order
+    added = []
+
+    while True:
+        message = conn.recv()
+        command = message[0]
+
+        if command == 'start':
+            state = BoardState(level, *message[1])
+            added = [store.add(level.encode(state.person, state.boxes), EMPTY, ' ', state.zobrist)]
+            conn.send(None)
+
+        elif command == 'layer':
+            solved = None
+            # the successors owned by the other workers, as columns of tags, keys, parents, directions
+            # and hashes.  Those this worker owns are added to its store straight away, with their tags
+            # in layer_tags, by their index less layer_start.
+            buckets = [(array('l'), [], array('l'), array('c'), array('l')) for _ in xrange(workers)]
+            layer_start = len(store)
+            layer_tags = array('l')
+            expanded = 0
+            generated = 0
+            counts = collections.Counter()
+            for rank, index in zip(message[1], added):
+                s = BoardState(level, *level.decode(store.key(index)), zobrist=store.hashes[index])
+                expanded += 1
+                if s.is_solved():
+                    solved = (rank, index * workers + number)
+                    break
+                parent = index * workers + number
+                for direction, new_s in step_successors(s, counts):
+                    generated += 1
+                    tag = rank * 4 + ORDER[direction]
+                    key_hash = new_s._zobrist
+                    owner = key_hash % workers
+                    if owner == number:
+                        if store.add(level.encode(new_s.person, new_s.boxes), parent, direction, key_hash) != EMPTY:
+                            layer_tags.append(tag)
+                    else:
+                        tags, keys, parents, directions, hashes = buckets[owner]
+                        tags.append(tag)
+                        keys.append(level.encode(new_s.person, new_s.boxes))
+                        parents.append(parent)
+                        directions.append(direction)
+                        hashes.append(key_hash)
+            if solved is not None:
+                buckets = [(array('l'), [], array('l'), array('c'), array('l')) for _ in xrange(workers)]
+
+            for owner, bucket in enumerate(buckets):
+                if owner != number:
+                    queues[owner].put(bucket)
+            received = [queues[number].get() for _ in xrange(workers - 1)]
+
+            accepted = array('l')
+            added = []
+            if solved is None:
+                for tags, keys, parents, directions, hashes in received:
+                    for tag, key, parent, direction, key_hash in zip(tags, keys, parents, directions, hashes):
+                        index = store.add(key, parent, direction, key_hash)
+                        if index != EMPTY:
+                            layer_tags.append(tag)
+                            continue
+                        # reached already, but if in this layer, it's the first in tag order that counts
+                        index = store.find(key, key_hash) - layer_start
+                        if index >= 0 and tag < layer_tags[index]:
+                            layer_tags[index] = tag
+                            store.parents[index + layer_start] = parent
+                            store.moves[index + layer_start] = direction
+                added = sorted(xrange(layer_start, len(store)), key=lambda index: layer_tags[index - layer_start])
+                accepted.extend(layer_tags[index - layer_start] for index in added)
+            conn.send((solved, accepted, expanded, generated, counts['pruned']))
+
+        elif command == 'parent':
+            index = message[1]
+            conn.send((store.parents[index], store.moves[index]))
+
+        elif command == 'stop':
+            conn.send(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+            conn.close()
+            return
+
+
+def solve(state, stats, workers=None, monitor=None):
+    """
+    breadth-first search of board states, one person step at a time, across worker processes,
+    returning the same list of moves as solve_bfs(), or None if there is no solution.  Progress
+    is reported to monitor, if given, once a layer, and the peak memory of the workers, added up,
+    is counted in stats['worker_peak_rss_kb'].
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    level = state.level
+
+    queues = [multiprocessing.Queue() for _ in xrange(workers)]
+    connections = []
+    processes = []
+    for number in xrange(workers):
+        conn, worker_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_worker, args=(
+            worker_conn, queues, number, level.board, level.target_locations))
+        process.daemon = True
+        process.start()
+        connections.append(conn)
+        processes.append(process)
+
+    try:
+        owner = state.zobrist % workers
+        connections[owner].send(('start', (state.person, state.boxes)))
+        connections[owner].recv()
+        ranks = [array('l', [0] if w == owner else []) for w in xrange(workers)]
+
+        solution = None
+        depth = 0
+        visited = 1
+        generated = 0
+        while True:
+            for w, conn in enumerate(connections):
+                conn.send(('layer', ranks[w]))
+            solved = []
+            accepted = []
+            for conn in connections:
+                found, tags, expanded, made, pruned = conn.recv()
+                stats['expanded'] += expanded
+                stats['pruned'] += pruned
+                generated += made
+                if found is not None:
+                    solved.append(found)
+                accepted.append(tags)
+            if solved:
+                solution = min(solved)[1]
+                break
+            if not any(accepted):
+                break
+            depth += 1
+            frontier = sum(len(tags) for tags in accepted)
+            visited += frontier
+            if monitor is not None:
+                monitor.layer(depth, frontier, visited, generated)
+
+            # rank the next layer in tag order, which each worker's accepted tags are already in
+            ranks = [array('l') for _ in xrange(workers)]
+            merged = heapq.merge(*[[(tag, w) for tag in tags] for w, tags in enumerate(accepted)])
+            for rank, (_, w) in enumerate(merged):
+                ranks[w].append(rank)
+
+        if solution is None:
+            return None
+
+        node = solution
+        moves = []
+        while True:
+            conn = connections[node % workers]
+            conn.send(('parent', node // workers))
+            node, direction = conn.recv()
+            if node == EMPTY:
+                break
+            moves.append(direction)
+        moves.reverse()
+        return moves
+
+    finally:
+        for conn in connections:
+            conn.send(('stop',))
+        # the workers run side by side, so their peaks add up
+        for conn in connections:
+            stats['worker_peak_rss_kb'] += conn.recv()
+        for process in processes:
+            process.join()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+# Pattern databases for the informed engines of the sokoban solver.
+#
+# A pattern database holds, for every placement of a few boxes (a pair, or a
+# triple) on a level with the other boxes taken away, the fewest pushes that
+# get them onto targets - any of the level's targets, one each.  These are
+# found once per level by a retrograde search: a breadth-first search of
+# pulls from every placement of the boxes on targets, with the person in
+# every region it could be in, so the first time a placement is reached is
+# its distance from the nearest goal.  Placements which are never reached
+# can't be solved at all, even without the other boxes in the way.
+#
+# Taking boxes away only makes pushing easier, and every push moves just one
+# box, so the pushes a solution makes of any group of boxes are at least the
+# group's entry.  Two ways of combining the entries give lower bounds:
+#
+#  - add: the boxes are split into disjoint groups, greedily taking the
+#    groups with the largest entries first, and their entries summed, with
+#    any boxes left over counting the pushes to their nearest target
+#  - max: the largest entry of any group
+#
+# and either way the bound is no less than the box-to-target matching of
+# heuristics, as the larger of the two is taken.
+#
+# The database is a file of one byte per placement, in the order of the
+# combinatorial number system, so that it can be memory mapped rather than
+# read in, after a header identifying the level it was built for.
+
+import itertools
+import mmap
+import struct
+import heuristics
+from sokoban_solver import read_levels
+from pushsearch import normalise, pulls, push
+
+MAGIC = 'SOKOPDB1'
+HEADER = struct.Struct('<8sII20s')
+
+# entries of more pushes than fit in a byte are stored as the most that do, which is still a lower bound
+UNSOLVABLE = 255
+MOST_PUSHES = 254
+
+COMBINATIONS = ('add', 'max')
+
+
+def binomials(n, size):
+    """ table of n choose k, as table[k][n], for k up to size """
+    table = [[0] * (n + 1) for _ in xrange(size + 1)]
+    for m in xrange(n + 1):
+        table[0][m] = 1
+        for k in xrange(1, min(m, size) + 1):
+            table[k][m] = table[k - 1][m - 1] + table[k][m - 1]
+    return table
+
+
+def placement_index(choose, cells):
+    """ the position of a placement, given as cells in ascending order, in the combinatorial number system """
+    index = 0
+    for k, cell in enumerate(cells):
+        index += choose[k + 1][cell]
+    return index
+
+
+def build(level, size=2):
+    """ the pattern database of the level for groups of size boxes, as a bytearray """
+    targets = level.indexes(level.targets)
+    if len(targets) < size:
+        raise Exception("level has fewer than {} targets".format(size))
+    choose = binomials(len(level.cells), size)
+    table = bytearray([UNSOLVABLE]) * choose[size][len(level.cells)]
+
+    frontier = []
+    seen = set()
+    for cells in itertools.combinations(targets, size):
+        boxes = level.pack(level.cells[cell] for cell in cells)
+        for cell in xrange(len(level.cells)):
+            if boxes & level.bits[cell]:
+                continue
+            key = (boxes, normalise(level, cell, boxes)[0])
+            if key not in seen:
+                seen.add(key)
+                frontier.append(key)
+
+    pushes = 0
+    while frontier:
+        next_frontier = []
+        for boxes, region in frontier:
+            index = placement_index(choose, level.indexes(boxes))
+            if table[index] == UNSOLVABLE:
+                table[index] = min(pushes, MOST_PUSHES)
+            reached = normalise(level, region, boxes)[1]
+            for box_cell, direction, to_cell in pulls(level, boxes, reached):
+                new_boxes = push(level, boxes, box_cell, to_cell)
+                key = (new_boxes, normalise(level, level.neighbours[direction][to_cell], new_boxes)[0])
+                if key not in seen:
+                    seen.add(key)
+                    next_frontier.append(key)
+        frontier = next_frontier
+        pushes += 1
+    return table
+
+
+def write(path, level, size, table):
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(level.cells), size, level.digest()))
+        f.write(table)
+
+
+class PatternDatabase(object):
+    """ the pattern database in the file at path, built for level, combining its entries by combine """
+
+    def __init__(self, path, level, combine='add'):
+        if combine not in COMBINATIONS:
+            raise Exception("unknown way of combining patterns '{}'".format(combine))
+        with open(path, 'rb') as f:
+            self.table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, cell_count, self.size, digest = HEADER.unpack(self.table[:HEADER.size])
+        if magic != MAGIC:
+            raise Exception("{} is not a pattern database".format(path))
+        if cell_count != len(level.cells) or digest != level.digest():
+            raise Exception("pattern database {} was built for a different level".format(path))
+        self.level = level
+        self.combine = combine
+        self.choose = binomials(cell_count, self.size)
+        distances = level.precomputed('push_distances', heuristics.push_distances)
+        self.nearest = [min(distance[cell] for distance in distances) for cell in xrange(cell_count)]
+
+    def close(self):
+        self.table.close()
+
+    def entry(self, cells):
+        """ the fewest pushes to get boxes on cells, in ascending order, onto targets, or None if they can't be """
+        pushes = ord(self.table[HEADER.size + placement_index(self.choose, cells)])
+        return None if pushes == UNSOLVABLE else pushes
+
+    def lower_bound(self, boxes):
+        """ a lower bound on the pushes to solve boxes, or None if they can't be solved """
+        level = self.level
+        matching = heuristics.matching_lower_bound(level, boxes)
+        if matching is None:
+            return None
+        cells = level.indexes(boxes)
+        if len(cells) < self.size:
+            return matching
+
+        groups = []
+        for group in itertools.combinations(cells, self.size):
+            pushes = self.entry(group)
+            if pushes is None:
+                return None
+            groups.append((pushes, group))
+        if self.combine == 'max':
+            return max(matching, max(groups)[0])
+
+        groups.sort(reverse=True)
+        total = 0
+        left = set(cells)
+        for pushes, group in groups:
+            if left.issuperset(group):
+                total += pushes
+                left.difference_update(group)
+        total += sum(self.nearest[cell] for cell in left)
+        return max(matching, total)
+
+
+def lower_bound(level, boxes, patterns=None):
+    """ the pattern database bound on the pushes to solve boxes if given patterns, otherwise the matching bound """
+    if patterns is None:
+        return heuristics.matching_lower_bound(level, boxes)
+    return patterns.lower_bound(boxes)
+
+
+def main():
+    import sys, argparse
+
+    parser = argparse.ArgumentParser(description="build a pattern database for a sokoban level")
+    parser.add_argument('level', help="file holding the level, in either notation")
+    parser.add_argument('output', help="file to write the pattern database to")
+    parser.add_argument('--size', type=int, default=2,
+                        help="number of boxes in each pattern, 2 for pairs or 3 for triples (default: 2)")
+    args = parser.parse_args()
+
+    with open(args.level) as f:
+        _, state = next(read_levels(f))
+    table = build(state.level, args.size)
+    write(args.output, state.level, args.size, table)
+    print >>sys.stderr, "{} placements, {} solvable".format(len(table), len(table) - table.count(chr(UNSOLVABLE)))
+
+
+if __name__ == "__main__":
+    main()
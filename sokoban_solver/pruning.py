@@ -0,0 +1,141 @@
+# Move pruning for the push-level engines of the sokoban solver.
+#
+# Two rules cut down the pushes tried from a state:
+#
+#  - tunnel macros: a box pushed along a one-wide tunnel, with walls either
+#    side of both the person and the box, is carried on to the end of it in a
+#    single move, as there's nothing else useful to do until it's out.  It
+#    stops short at a target, or at anything in the way.
+#
+#  - PI-corral pruning: a corral is an area the person can't get to, walled
+#    in by boxes.  If every push the person can make of the boxes around it
+#    goes into it (an I-corral), and the person can get to every push into it
+#    (a P-corral), and the boxes in and around it aren't all on targets
+#    already, then one of those pushes has to be made sooner or later, and
+#    nothing else gets in its way, so only they are tried.  This is what stops
+#    a level of several independent rooms from being searched in every order
+#    its pushes can be interleaved.
+#
+# Both keep the fewest pushes, as long as the search counts the pushes in a
+# tunnel macro, as the informed engines do.
+
+import deadlocks
+from sokoban_solver import DIRECTIONS, OPPOSITE
+from pushsearch import pushes, push
+
+# the directions at right angles to each direction
+ACROSS = {'U': ('L', 'R'), 'D': ('L', 'R'), 'L': ('U', 'D'), 'R': ('U', 'D')}
+
+
+def _walled_across(level, cell, direction):
+    """ are both sides of cell, across direction, walls? """
+    return all(level.neighbours[side][cell] is None for side in ACROSS[direction])
+
+
+def tunnel_end(level, boxes, box_cell, direction, to_cell):
+    """
+    the cell a box pushed from box_cell to to_cell ends up on once it's carried along any tunnel
+    it was pushed down, with the number of pushes that takes
+    """
+    neighbours = level.neighbours[direction]
+    bits = level.bits
+    count = 1
+    while (_walled_across(level, box_cell, direction) and _walled_across(level, to_cell, direction)
+           and not level.targets & bits[to_cell]):
+        next_cell = neighbours[to_cell]
+        if next_cell is None or boxes & bits[next_cell]:
+            break
+        box_cell, to_cell = to_cell, next_cell
+        count += 1
+    return to_cell, count
+
+
+def pi_corral(level, boxes, reached):
+    """
+    the (boundary boxes, cells) of a PI-corral of the position with the person on the reached cells,
+    needing the fewest pushes into it, or None if there is none
+    """
+    bits = level.bits
+    neighbours = level.neighbours
+    outside = bytearray(len(level.cells))
+    for cell in reached:
+        outside[cell] = 1
+
+    best = None
+    best_pushes = None
+    seen = bytearray(len(level.cells))
+    for start in xrange(len(level.cells)):
+        if outside[start] or seen[start] or boxes & bits[start]:
+            continue
+
+        # the area reached from start without going through the person's, and the boxes in it
+        area = 0
+        seen[start] = 1
+        stack = [start]
+        while stack:
+            cell = stack.pop()
+            area |= bits[cell]
+            for next_cell in level.adjacent[cell]:
+                if not outside[next_cell] and not seen[next_cell]:
+                    seen[next_cell] = 1
+                    stack.append(next_cell)
+
+        if area & boxes & level.targets == area & boxes and not area & level.targets & ~boxes:
+            # nothing in it to do
+            continue
+
+        corral = area & ~boxes
+        boundary = [box_cell for box_cell in level.indexes(area & boxes)
+                    if any(outside[next_cell] for next_cell in level.adjacent[box_cell])]
+        inward = 0
+        is_pi = True
+        for box_cell in boundary:
+            for direction in DIRECTIONS:
+                behind = neighbours[OPPOSITE[direction]][box_cell]
+                to_cell = neighbours[direction][box_cell]
+                if behind is None or to_cell is None or boxes & bits[behind] or boxes & bits[to_cell]:
+                    continue
+                if outside[behind]:
+                    if not corral & bits[to_cell]:
+                        # the person could push a box out of it, or along it
+                        is_pi = False
+                        break
+                    inward += 1
+                elif corral & bits[to_cell]:
+                    # a push into it the person can't get to
+                    is_pi = False
+                    break
+            if not is_pi:
+                break
+
+        if is_pi and inward and (best is None or inward < best_pushes):
+            best = (frozenset(boundary), corral)
+            best_pushes = inward
+    return best
+
+
+def pruned_pushes(level, boxes, reached, stats=None, tunnels=True, corrals=True):
+    """
+    generates (box_cell, direction, to_cell, count) for the pushes worth trying from the reached
+    cells, with count the number of pushes, more than one for a tunnel macro.  Pushes which deadlock
+    the level are left out, and counted in stats['pruned'].
+    """
+    candidates = list(pushes(level, boxes, reached, stats))
+    corral = pi_corral(level, boxes, reached) if corrals else None
+    if corral is not None:
+        boundary, cells = corral
+        into_corral = [(box_cell, direction, to_cell) for box_cell, direction, to_cell in candidates
+                       if box_cell in boundary and cells & level.bits[to_cell]]
+        # should every push into it deadlock, that's left for the search to find out
+        if into_corral:
+            candidates = into_corral
+
+    for box_cell, direction, to_cell in candidates:
+        count = 1
+        if tunnels:
+            to_cell, count = tunnel_end(level, boxes, box_cell, direction, to_cell)
+            if count > 1 and deadlocks.is_deadlock(level, push(level, boxes, box_cell, to_cell), to_cell):
+                if stats is not None:
+                    stats['pruned'] += 1
+                continue
+        yield box_cell, direction, to_cell, count
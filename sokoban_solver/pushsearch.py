@@ -0,0 +1,212 @@
+# Push-level search for the sokoban solver.
+#
+# Rather than searching single person steps, a state here is the set of boxes
+# plus the region of the board the person can walk around in without pushing
+# anything.  The region is represented by the smallest cell index in it, so
+# that two states differing only in where the person stands are the same
+# state.  Successors of a state are all the pushes the person can make from
+# anywhere in its region, less any that deadlock the level, and the walking
+# in between pushes is only worked out once a solution has been found.
+
+import collections
+import deadlocks
+from sokoban_solver import DIRECTIONS, OPPOSITE
+
+
+def reachable(level, person, boxes):
+    """ flood fill of the cells the person can walk to without pushing a box """
+    adjacent = level.adjacent
+    bits = level.bits
+    seen = bytearray(len(level.cells))
+    seen[person] = 1
+    reached = [person]
+    stack = [person]
+    while stack:
+        cell = stack.pop()
+        for to_cell in adjacent[cell]:
+            if not seen[to_cell] and not boxes & bits[to_cell]:
+                seen[to_cell] = 1
+                reached.append(to_cell)
+                stack.append(to_cell)
+    return reached
+
+
+def normalise(level, person, boxes):
+    """ returns (region, reached), where region is the canonical person cell of the reached cells """
+    reached = reachable(level, person, boxes)
+    return min(reached), reached
+
+
+def pushes(level, boxes, reached, stats=None):
+    """
+    generates (box_cell, direction, to_cell) for every push that can be made from the reached cells,
+    leaving out those which deadlock the level, which are counted in stats['pruned']
+    """
+    bits = level.bits
+    for direction in DIRECTIONS:
+        neighbours = level.neighbours[direction]
+        for cell in reached:
+            box_cell = neighbours[cell]
+            if box_cell is not None and boxes & bits[box_cell]:
+                to_cell = neighbours[box_cell]
+                if to_cell is not None and not boxes & bits[to_cell]:
+                    if deadlocks.is_deadlock(level, push(level, boxes, box_cell, to_cell), to_cell):
+                        if stats is not None:
+                            stats['pruned'] += 1
+                        continue
+                    yield box_cell, direction, to_cell
+
+
+def pulls(level, boxes, reached):
+    """
+    generates (box_cell, direction, to_cell) for every pull the person can make from the reached
+    cells, stepping in direction, and dragging the box on box_cell behind it onto the cell it left.
+    The person ends up on the neighbour of to_cell in direction, and undoing the pull is a push of
+    the box on to_cell in the opposite direction.
+    """
+    bits = level.bits
+    for direction in DIRECTIONS:
+        neighbours = level.neighbours[direction]
+        behind = level.neighbours[OPPOSITE[direction]]
+        for cell in reached:
+            step = neighbours[cell]
+            if step is None or boxes & bits[step]:
+                continue
+            box_cell = behind[cell]
+            if box_cell is not None and boxes & bits[box_cell]:
+                yield box_cell, direction, cell
+
+
+def goal_states(level):
+    """ the (boxes, region) states with every box on a target, one for each region the person can be in """
+    boxes = level.targets
+    seen = set()
+    goals = []
+    for cell, bit in enumerate(level.bits):
+        if boxes & bit or cell in seen:
+            continue
+        region, reached = normalise(level, cell, boxes)
+        seen.update(reached)
+        goals.append((boxes, region))
+    return goals
+
+
+def push(level, boxes, box_cell, to_cell):
+    """ the boxes after moving a box from box_cell to to_cell """
+    return boxes ^ level.bits[box_cell] | level.bits[to_cell]
+
+
+def walk(level, start, goal, boxes):
+    """ the shortest list of steps for the person to walk from start to goal, or None """
+    if start == goal:
+        return []
+    bits = level.bits
+    came_from = {start: None}
+    queue = collections.deque([start])
+    while queue:
+        cell = queue.popleft()
+        for direction in DIRECTIONS:
+            to_cell = level.neighbours[direction][cell]
+            if to_cell is None or to_cell in came_from or boxes & bits[to_cell]:
+                continue
+            came_from[to_cell] = (cell, direction)
+            if to_cell == goal:
+                steps = []
+                while came_from[to_cell] is not None:
+                    to_cell, direction = came_from[to_cell]
+                    steps.append(direction)
+                steps.reverse()
+                return steps
+            queue.append(to_cell)
+    return None
+
+
+def moves_for_pushes(state, push_list):
+    """
+    Expands a list of (box_cell, direction) pushes made from state into the full list of
+    person moves, walking the person to behind each box in turn.  A push can also be given
+    as (box_cell, direction, to_cell), for a box pushed on in the same direction to to_cell.
+    """
+    level = state.level
+    neighbours = level.neighbours
+    person = state.person
+    boxes = state.boxes
+    moves = []
+    for pushed in push_list:
+        box_cell, direction = pushed[:2]
+        to_cell = pushed[2] if len(pushed) > 2 else neighbours[direction][box_cell]
+        behind = neighbours[OPPOSITE[direction]][box_cell]
+        steps = walk(level, person, behind, boxes)
+        if steps is None:
+            raise Exception("push of box at {} is unreachable".format(level.cells[box_cell]))
+        moves.extend(steps)
+        person = behind
+        while neighbours[direction][person] != to_cell:
+            moves.append(direction)
+            person = neighbours[direction][person]
+        boxes = push(level, boxes, box_cell, to_cell)
+    return moves
+
+
+def push_path(parent, solution):
+    """
+    The list of (box_cell, direction) pushes leading to solution, from a map of each
+    state to (parent state, box_cell, direction), which is None for the start state.
+    Links of (parent state, box_cell, direction, to_cell) give pushes of three, as
+    taken by moves_for_pushes().
+    """
+    push_list = []
+    while parent[solution] is not None:
+        link = parent[solution]
+        solution = link[0]
+        push_list.append(link[1:])
+    push_list.reverse()
+    return push_list
+
+
+def solve(state, stats, monitor=None):
+    """
+    breadth-first search of pushes, returning the list of moves of a solution with
+    the fewest pushes, or None if there is no solution, reporting progress to monitor
+    if given
+    """
+    level = state.level
+    region, _ = normalise(level, state.person, state.boxes)
+    start = (state.boxes, region)
+
+    # parent maps a (boxes, region) state to (parent state, box_cell, direction)
+    parent = {start: None}
+    queue = collections.deque([start])
+    solution = None
+
+    # states are queued in the order they're added to parent, so the number taken off the queue
+    # shows when a layer ends
+    taken = 0
+    depth = 0
+    layer_end = 1
+    generated = 0
+    while queue:
+        if taken == layer_end:
+            depth += 1
+            layer_end = len(parent)
+        taken += 1
+        key = queue.popleft()
+        boxes, region = key
+        stats['expanded'] += 1
+        if monitor is not None:
+            monitor.update(depth, len(queue), len(parent), generated)
+        if boxes == level.targets:
+            solution = key
+            break
+        for box_cell, direction, to_cell in pushes(level, boxes, reachable(level, region, boxes), stats):
+            new_boxes = push(level, boxes, box_cell, to_cell)
+            new_key = (new_boxes, normalise(level, box_cell, new_boxes)[0])
+            generated += 1
+            if new_key not in parent:
+                parent[new_key] = (key, box_cell, direction)
+                queue.append(new_key)
+
+    if solution is None:
+        return None
+
+    return moves_for_pushes(state, push_path(parent, solution))
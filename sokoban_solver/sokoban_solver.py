@@ -42,96 +42,225 @@
 # #######
 
 
-class BoardState(object):
-
-    __slots__ = ['board', 'target_locations', 'person_location', 'box_locations']
+import hashlib
+import itertools
+import random
+
+DIRECTIONS = ('U', 'D', 'L', 'R')
+OPPOSITE = {'U': 'D', 'D': 'U', 'L': 'R', 'R': 'L'}
+
+
+def calculate_move_to_cell(location, direction):
+    """ Helper function to calculate move-to cell """
+    tr, tc = location
+    if direction == 'U':
+        tr = tr - 1
+    elif direction == 'D':
+        tr = tr + 1
+    elif direction == 'L':
+        tc = tc - 1
+    elif direction == 'R':
+        tc = tc + 1
+    else:
+        raise Exception("bad direction: '{}'".format(direction))
+    return (tr, tc)
+
+
+def _signed64(n):
+    """ an unsigned 64 bit int as a signed one, which fits in a native int """
+    return n - (1 << 64) if n >= 1 << 63 else n
+
+
+class Level(object):
+    """
+    The static part of a board - walls and targets - which is shared by
+    every BoardState of a search rather than being copied into each one.
+
+    Every square that is not a wall is given a flat cell index, so that a
+    set of boxes can be packed into a single int bitmask.  For each direction
+    a neighbour table maps a cell index to the index of the adjacent cell,
+    or None if that is a wall or off the board, and the adjacent table lists
+    all the cells next to a cell, for flood fills.
+
+    The Zobrist tables hold a random 64 bit key for each cell, one for a box
+    and one for the person on it, which are XOR-ed together for the hash of
+    a state.  For each direction, the step tables hold the change in that
+    hash from moving the person, or a box, from a cell to its neighbour.
+
+    Anything else worked out once per level, such as distance tables for the
+    heuristics, is kept in tables - see precomputed().
+    """
+
+    __slots__ = ['board', 'target_locations', 'cells', 'cell_index', 'bits', 'targets', 'neighbours', 'adjacent',
+                 'person_bits', 'zobrist_boxes', 'zobrist_person', 'person_steps', 'box_steps', 'tables']
+
+    def __init__(self, board, target_locations):
+        self.board = tuple(board)
+        self.target_locations = frozenset(target_locations)
+
+        self.cells = tuple((r, c)
+                           for r in xrange(len(self.board))
+                           for c in xrange(len(self.board[r]))
+                           if self.board[r][c] != '#')
+        self.cell_index = dict((location, i) for i, location in enumerate(self.cells))
+        self.bits = tuple(1 << i for i in xrange(len(self.cells)))
+        self.targets = self.pack(self.target_locations)
+
+        self.neighbours = {}
+        for direction in DIRECTIONS:
+            self.neighbours[direction] = tuple(self.cell_index.get(calculate_move_to_cell(location, direction))
+                                               for location in self.cells)
+        self.adjacent = tuple(tuple(self.neighbours[direction][i]
+                                    for direction in DIRECTIONS
+                                    if self.neighbours[direction][i] is not None)
+                              for i in xrange(len(self.cells)))
+        self.person_bits = max(1, (len(self.cells) - 1).bit_length())
+
+        # seeded, so that every Level of the same board hashes states the same way
+        rng = random.Random(len(self.cells))
+        self.zobrist_boxes = tuple(_signed64(rng.getrandbits(64)) for _ in self.cells)
+        self.zobrist_person = tuple(_signed64(rng.getrandbits(64)) for _ in self.cells)
+        self.person_steps = {}
+        self.box_steps = {}
+        for direction in DIRECTIONS:
+            neighbours = self.neighbours[direction]
+            self.person_steps[direction] = tuple(
+                None if neighbours[i] is None else self.zobrist_person[i] ^ self.zobrist_person[neighbours[i]]
+                for i in xrange(len(self.cells)))
+            self.box_steps[direction] = tuple(
+                None if neighbours[i] is None else self.zobrist_boxes[i] ^ self.zobrist_boxes[neighbours[i]]
+                for i in xrange(len(self.cells)))
+        self.tables = {}
+
+    def precomputed(self, name, build):
+        """ a per-level table, built by calling build(level) the first time it is asked for """
+        if name not in self.tables:
+            self.tables[name] = build(self)
+        return self.tables[name]
+
+    def pack(self, locations):
+        """ (r, c) locations -> bitmask of cell indexes """
+        mask = 0
+        for location in locations:
+            mask |= self.bits[self.cell_index[location]]
+        return mask
+
+    def unpack(self, mask):
+        """ bitmask of cell indexes -> frozenset of (r, c) locations """
+        return frozenset(location for i, location in enumerate(self.cells) if mask & self.bits[i])
+
+    def encode(self, person, boxes):
+        """ a state as a single unsigned int, of key_bits() bits """
+        return boxes << self.person_bits | person
+
+    def decode(self, key):
+        """ encode()d int -> (person, boxes) """
+        return key & ((1 << self.person_bits) - 1), key >> self.person_bits
+
+    def key_bits(self):
+        return len(self.cells) + self.person_bits
+
+    def digest(self):
+        """ SHA-1 of the level's squares and targets, to check a file written for a level is for this one """
+        return hashlib.sha1(repr((self.cells, sorted(self.target_locations)))).digest()
+
+    def indexes(self, mask):
+        """ bitmask of cell indexes -> list of the cell indexes, in ascending order """
+        indexes = []
+        while mask:
+            lowest = mask & -mask
+            indexes.append(lowest.bit_length() - 1)
+            mask ^= lowest
+        return indexes
 
-    def __init__(self, board, target_locations, person_location, box_locations):
 
-        # ensuring members are tuples and frozensets ensures
-        # the object is hashable, and can be put in a dictionary and set
-        if type(board).__name__ <> 'tuple':
-            board = tuple(board)
-        if type(target_locations).__name__ <> 'frozenset':
-            target_locations = frozenset(target_locations)
-        if type(person_location).__name__ <> 'tuple':
-            person_location = tuple(person_location)
-        if type(box_locations).__name__ <> 'frozenset':
-            box_locations = frozenset(box_locations)
+class BoardState(object):
 
-        self.board = board
-        self.target_locations = target_locations
-        self.person_location = person_location
-        self.box_locations = box_locations
+    __slots__ = ['level', 'person', 'boxes', '_zobrist']
+
+    def __init__(self, level, person, boxes, zobrist=None):
+        # person is a cell index, and boxes a bitmask of cell indexes, see Level
+        self.level = level
+        self.person = person
+        self.boxes = boxes
+        # worked out when it's first wanted, as states decoded from a store are often never hashed
+        self._zobrist = zobrist
+
+    @property
+    def zobrist(self):
+        if self._zobrist is None:
+            level = self.level
+            zobrist = level.zobrist_person[self.person]
+            for box in level.indexes(self.boxes):
+                zobrist ^= level.zobrist_boxes[box]
+            self._zobrist = zobrist
+        return self._zobrist
+
+    @property
+    def board(self):
+        return self.level.board
+
+    @property
+    def target_locations(self):
+        return self.level.target_locations
+
+    @property
+    def person_location(self):
+        return self.level.cells[self.person]
+
+    @property
+    def box_locations(self):
+        return self.level.unpack(self.boxes)
 
     def __hash__(self):
-        return hash((self.board, self.person_location, self.box_locations))
+        return self.zobrist
 
     def __eq__(self, other):
-        return (self.board, self.person_location, self.box_locations) == (other.board, other.person_location, other.box_locations)
-
-    def calculate_move_to_cell(self, location, direction):
-        """ Helper function to calculate move-to cell """
-        tr, tc = location
-        if direction == 'U':
-            tr = tr - 1
-        elif direction == 'D':
-            tr = tr + 1
-        elif direction == 'L':
-            tc = tc - 1
-        elif direction == 'R':
-            tc = tc + 1
-        else:
-            raise Exception("bad direction: '{}'".format(direction))
-        return (tr, tc)
+        return self.person == other.person and self.boxes == other.boxes
 
-    def is_within_bounds(self, location):
-        """ Helper function to determine if a move-to cell is within bounds """
-        r, c = location
-        if r < 0 or c < 0 or r > len(self.board)-1 or c > len(self.board[0])-1:
-            return False
-        else:
-            return True
+    def __ne__(self, other):
+        return not self == other
 
     def can_move(self, direction):
         """ can the person move in this direction? """
-        tr, tc = self.calculate_move_to_cell(self.person_location, direction)
+        to_cell = self.level.neighbours[direction][self.person]
 
-        if not self.is_within_bounds((tr, tc)):
+        if to_cell is None:
             return False
-
-        if self.board[tr][tc] == '#':
-            return False
-        elif (tr, tc) in self.box_locations:
-            return self.box_can_move((tr,tc), direction)
+        elif self.boxes & self.level.bits[to_cell]:
+            return self.box_can_move(to_cell, direction)
         else:
             return True
 
-    def box_can_move(self, box_location, direction):
+    def box_can_move(self, box_cell, direction):
         """ can a box be pushed in this direction? """
-        tr, tc = self.calculate_move_to_cell(box_location, direction)
-
-        if not self.is_within_bounds((tr, tc)):
-            return False
+        to_cell = self.level.neighbours[direction][box_cell]
 
-        if self.board[tr][tc] == '#':
+        if to_cell is None:
             return False
-        elif (tr, tc) in self.box_locations:
+        elif self.boxes & self.level.bits[to_cell]:
             return False
         else:
             return True
 
     def is_solved(self):
-        return self.box_locations == self.target_locations
+        return self.boxes == self.level.targets
 
     def move(self, direction):
-        tr, tc = self.calculate_move_to_cell(self.person_location, direction)
-        box_locations = set(self.box_locations)
-        if (tr, tc) in box_locations:
-            br, bc = self.calculate_move_to_cell((tr, tc), direction)
-            box_locations.remove((tr, tc))
-            box_locations.add((br, bc))
-        return BoardState(self.board, self.target_locations, (tr, tc), box_locations)
+        level = self.level
+        neighbours = level.neighbours[direction]
+        bits = level.bits
+        to_cell = neighbours[self.person]
+        boxes = self.boxes
+        # the hash is only carried on if this state has one already
+        zobrist = self._zobrist
+        if zobrist is not None:
+            zobrist ^= level.person_steps[direction][self.person]
+        if boxes & bits[to_cell]:
+            boxes = boxes ^ bits[to_cell] | bits[neighbours[to_cell]]
+            if zobrist is not None:
+                zobrist ^= level.box_steps[direction][to_cell]
+        return BoardState(level, to_cell, boxes, zobrist)
 
 
 def read_board(stream):
@@ -179,9 +308,9 @@ def read_board(stream):
             if board1[r][c] == '#' and board2[r][c] <> '#':
                 raise Exception("walls are inconsistent")
             if board1[r][c] not in ('#', ' ', 'X'):
-                raise Exception("unexpected character '{}' found in first board".format(board[r][c]))
+                raise Exception("unexpected character '{}' found in first board".format(board1[r][c]))
             if board2[r][c] not in ('#', ' ', '*', 'B'):
-                raise Exception("unexpected character '{}' found in second board".format(board[r][c]))
+                raise Exception("unexpected character '{}' found in second board".format(board2[r][c]))
 
     person_location = None
     target_locations = set()
@@ -196,55 +325,364 @@ def read_board(stream):
             if board2[r][c] == 'B':
                 box_locations.add( (r, c) )
 
-    state = BoardState(board1, target_locations, person_location, box_locations)
+    if person_location is None:
+        raise Exception("no person found in second board")
 
-    return state
+    return make_state(board1, target_locations, person_location, box_locations)
 
 
-def main():
-    import sys, collections
+def make_state(board, target_locations, person_location, box_locations):
+    """ the starting BoardState of a level, where board is a list of rows, of '#' for walls """
+    level = Level(board, target_locations)
+    return BoardState(level, level.cell_index[person_location], level.pack(box_locations))
+
+
+# The standard sokoban notation has one grid per level, rows of which may be
+# indented and of differing lengths, with
+#
+#  # - wall
+#  $ - box
+#  . - target square
+#  * - box on a target
+#  @ - person
+#  + - person on a target
+#  ' ', '-' or '_' - blank space
+#
+# A collection of levels has grids separated by other lines, which can hold
+# each level's title, such as "; 12" or "Title: Corners".
 
-    if len(sys.argv) != 2:
-        print "usage: sokoban_solver.py mapfile"
-        exit(1)
+XSB_CHARACTERS = frozenset('#$.*@+ -_')
+TWO_BOARD_CHARACTERS = frozenset('#XB* ')
 
-    f = open(sys.argv[1])
 
-    state = read_board(f)
+def read_xsb(rows):
+    """ the starting BoardState of a level in the standard notation, given as a list of rows """
+    rows = [row.rstrip() for row in rows]
+    column_count = max(len(row) for row in rows)
+    board = []
+    person_location = None
+    target_locations = set()
+    box_locations = set()
 
-    # simple breadth-first search of board states
+    for r, row in enumerate(rows):
+        board.append(''.join('#' if ch == '#' else ' ' for ch in row.ljust(column_count)))
+        for c, ch in enumerate(row):
+            if ch not in XSB_CHARACTERS:
+                raise Exception("unexpected character '{}' found in board".format(ch))
+            if ch in '.*+':
+                target_locations.add((r, c))
+            if ch in '$*':
+                box_locations.add((r, c))
+            if ch in '@+':
+                if person_location is not None:
+                    raise Exception("more than one person found in board")
+                person_location = (r, c)
 
-    move_to_get_to = {}
-    parent = {}
-    queue = collections.deque()
-    move_to_get_to[state] = ''
-    parent[state] = None
-    queue.append(state)
+    if person_location is None:
+        raise Exception("no person found in board")
+
+    return make_state(board, target_locations, person_location, box_locations)
+
+
+def _is_grid_line(line):
+    return '#' in line and (set(line) <= XSB_CHARACTERS or set(line) <= TWO_BOARD_CHARACTERS)
+
+
+def _read_level(reader, lines, errors):
+    try:
+        return reader(lines)
+    except Exception as e:
+        if not errors:
+            raise
+        return e
+
+
+def read_levels(stream, errors=False):
+    """
+    Generates (title, state) for each level of a collection, in either the standard notation or
+    the two board format above.  A level's title is the last other line before its grid, or its
+    position in the collection.  With errors, a level that can't be read is generated as
+    (title, the exception raised) rather than stopping the collection there.
+    """
+    title = None
+    grid = []
+    first_board = None
+    count = 0
+
+    # a blank line at the end finishes off the last grid
+    for line in itertools.chain(stream, ['']):
+        line = line.rstrip('\r\n')
+        if _is_grid_line(line):
+            grid.append(line)
+            continue
+
+        if grid:
+            if any(ch in row for row in grid for ch in 'XB'):
+                # the two board format, as understood by read_board
+                if first_board is None:
+                    first_board = grid
+                else:
+                    count += 1
+                    yield title or str(count), _read_level(read_board, first_board + [''] + grid, errors)
+                    title = None
+                    first_board = None
+            else:
+                count += 1
+                yield title or str(count), _read_level(read_xsb, grid, errors)
+                title = None
+            grid = []
+
+        line = line.strip()
+        if line and first_board is None:
+            title = line.lstrip(';').strip()
+            if title.lower().startswith('title:'):
+                title = title[len('title:'):].strip()
+
+
+def step_successors(s, stats=None):
+    """
+    generates (direction, new state) for each step the person can take from s, leaving out pushes
+    which deadlock the level, which are counted in stats['pruned'] if stats is given
+    """
+    import deadlocks
+
+    level = s.level
+    for direction in DIRECTIONS:
+        if s.can_move(direction):
+            new_s = s.move(direction)
+            if new_s.boxes != s.boxes and deadlocks.is_deadlock(level, new_s.boxes,
+                                                                level.neighbours[direction][new_s.person]):
+                if stats is not None:
+                    stats['pruned'] += 1
+                continue
+            yield direction, new_s
+
+
+# states expanded between looks at the clock, to see if a checkpoint is due
+CHECKPOINT_EVERY = 1024
+
+
+def solve_bfs(state, stats, monitor=None, checkpoint=None, checkpoint_interval=60.0, resume=False):
+    """
+    simple breadth-first search of board states, one person step at a time,
+    returning the list of moves, or None if there is no solution.  Pushes
+    which deadlock the level are pruned.  Progress is reported to monitor,
+    if given - see telemetry.  If checkpoint is given, the search is saved
+    to that file every checkpoint_interval seconds, and if resume is set,
+    carries on from the last checkpoint in it, if there is one.
+    """
+    from statestore import StateStore, EMPTY
+
+    level = state.level
+
+    saver = None
+    restored = None
+    if checkpoint is not None:
+        import checkpoint as checkpoints
+        saver = checkpoints.Checkpoint(checkpoint, level, checkpoint_interval)
+        if resume:
+            restored = saver.restore(stats)
+
+    if restored is not None:
+        store, index, depth, layer_end, generated = restored
+    else:
+        # states seen are kept in the store, in the order they are to be expanded
+        store = StateStore(level.key_bits())
+        store.add(level.encode(state.person, state.boxes), EMPTY, ' ', state.zobrist)
+        index = 0
+        depth = 0
+        layer_end = 1
+        generated = 0
     solution = None
 
-    cnt = 0
-    while(len(queue)):
-        s = queue.popleft()
+    while index < len(store):
+        if saver is not None and not index % CHECKPOINT_EVERY and saver.due():
+            saver.save(store, index, depth, layer_end, generated, stats)
+        if index == layer_end:
+            depth += 1
+            layer_end = len(store)
+        person, boxes = level.decode(store.key(index))
+        s = BoardState(level, person, boxes, store.hashes[index])
+        stats['expanded'] += 1
+        if monitor is not None:
+            monitor.update(depth, len(store) - index, len(store), generated)
         if s.is_solved():
-            solution = s
+            solution = index
             break
-        for direction in ('U', 'D', 'L', 'R'):
-            if s.can_move(direction):
-                new_s = s.move(direction)
-                if new_s not in move_to_get_to:
-                    move_to_get_to[new_s] = direction
-                    parent[new_s] = s
-                    queue.append(new_s)
-
-    moves = []
-    while solution:
-        # if stops us adding the very first entry where direction == ''
-        if move_to_get_to[solution]:
-            moves.append(move_to_get_to[solution])
-        solution = parent[solution]
-    moves.reverse()
-
-    if len(moves) == 0:
+        for direction, new_s in step_successors(s, stats):
+            generated += 1
+            # s was made with its hash, so new_s has its own, carried on from it
+            store.add(level.encode(new_s.person, new_s.boxes), index, direction, new_s._zobrist)
+        index += 1
+
+    if saver is not None:
+        saver.close()
+    if solution is None:
+        return None
+    return store.path(solution)
+
+
+def count_pushes(state, moves):
+    """ the number of moves, made from state, which push a box """
+    pushes = 0
+    for direction in moves:
+        new_state = state.move(direction)
+        if new_state.boxes != state.boxes:
+            pushes += 1
+        state = new_state
+    return pushes
+
+
+def engines():
+    """
+    The search engines, by name.  Each is called as engine(state, stats, **options), with stats
+    a Counter the engine adds to, and returns the list of moves solving the level, or None.
+    Every engine takes a monitor option, for progress reports - see telemetry.
+    """
+    import pushsearch
+    import informed
+    import bidirectional
+    import parallel
+    import external
+    import anytime
+    import vectorized
+
+    return {
+        'bfs': solve_bfs,
+        'push': pushsearch.solve,
+        'astar': informed.solve_astar,
+        'idastar': informed.solve_idastar,
+        'bidir': bidirectional.solve,
+        'parallel': parallel.solve,
+        'external': external.solve,
+        'anytime': anytime.solve,
+        'vectorized': vectorized.solve,
+    }
+
+
+ENGINE_HELP = ("bfs searches single person steps, push searches box pushes, astar and idastar search "
+               "box pushes guided by a lower bound on the pushes left, bidir searches pushes forwards and "
+               "pulls backwards from the solution at once, parallel runs the bfs search across several "
+               "processes, external runs it with its layers kept on disk, and anytime finds a solution "
+               "quickly and then better ones, fewer pushes at a time, until --time-budget runs out, and "
+               "vectorized runs the bfs search a layer at a time with numpy (default: bfs)")
+
+
+def main():
+    import sys, argparse, collections, time
+    import telemetry
+
+    parser = argparse.ArgumentParser(description="sokoban solver")
+    parser.add_argument('mapfile')
+    parser.add_argument('--engine', choices=sorted(engines()), default='bfs', help=ENGINE_HELP)
+    parser.add_argument('--workers', type=int,
+                        help="number of worker processes for the parallel engine (default: one per cpu)")
+    parser.add_argument('--workdir',
+                        help="directory for the external engine's layer files (default: system temporary directory)")
+    parser.add_argument('--layers-window', type=int, default=0,
+                        help="number of earlier layers the external engine checks for repeated states "
+                             "(default: 0, meaning all)")
+    parser.add_argument('--time-budget', type=float,
+                        help="seconds the anytime engine has to improve on its solution (default: no limit, "
+                             "so that it ends with the fewest pushes).  Its first solution is always found, "
+                             "however long that takes")
+    parser.add_argument('--prune', action='store_true',
+                        help="have the astar, idastar and anytime engines carry boxes through tunnels, and only try "
+                             "pushes into a PI-corral when there is one")
+    parser.add_argument('--table-mb', type=float,
+                        help="megabytes of transposition table for the idastar engine, which then takes no more "
+                             "memory than that however long it runs, and which it needs to find out that a level "
+                             "has no solution (default: 16, 0 for none)")
+    parser.add_argument('--patterns',
+                        help="pattern database of the level, built by patterns.py, for the astar, idastar and "
+                             "anytime engines' lower bound")
+    parser.add_argument('--combine', choices=('add', 'max'), default='add',
+                        help="whether to add up the pattern database's entries for disjoint groups of boxes, or "
+                             "take the largest (default: add)")
+    parser.add_argument('--checkpoint',
+                        help="file to save the bfs engine's search to as it goes, so it can be resumed")
+    parser.add_argument('--checkpoint-interval', type=float, default=60.0,
+                        help="seconds between checkpoints (default: 60)")
+    parser.add_argument('--resume', action='store_true',
+                        help="carry on from the last checkpoint in the --checkpoint file, if there is one")
+    parser.add_argument('--cache',
+                        help="SQLite file of solutions to look the level up in first, and to add new ones to")
+    parser.add_argument('--cache-mb', type=float,
+                        help="size to keep the cache within, evicting the least recently used solutions "
+                             "(default: no limit)")
+    parser.add_argument('--progress', action='store_true',
+                        help="report the search's progress to stderr as it goes")
+    parser.add_argument('--stats-file',
+                        help="file to write the search's progress to, as lines of JSON")
+    parser.add_argument('--stats-interval', type=float, default=1.0,
+                        help="seconds between progress reports (default: 1)")
+    args = parser.parse_args()
+
+    started = time.time()
+
+    def report(moves):
+        print >>sys.stderr, "{:.2f}s: found a solution of {} moves, {} pushes".format(
+            time.time() - started, len(moves), count_pushes(state, moves))
+
+    # engine specific options
+    options = {
+        'bfs': dict(checkpoint=args.checkpoint, checkpoint_interval=args.checkpoint_interval, resume=args.resume),
+        'parallel': dict(workers=args.workers),
+        'external': dict(workdir=args.workdir, window=args.layers_window),
+        'astar': dict(prune=args.prune),
+        'idastar': dict(prune=args.prune),
+        'anytime': dict(time_budget=args.time_budget, prune=args.prune, report=report),
+    }
+
+    if args.table_mb is not None:
+        options['idastar']['table_mb'] = args.table_mb
+
+    f = open(args.mapfile)
+
+    state = read_board(f)
+
+    if args.patterns:
+        import patterns
+        database = patterns.PatternDatabase(args.patterns, state.level, args.combine)
+        for name in ('astar', 'idastar', 'anytime'):
+            options[name]['patterns'] = database
+
+    cache = None
+    if args.cache:
+        import solutioncache
+        max_bytes = int(args.cache_mb * 1024 * 1024) if args.cache_mb is not None else None
+        cache = solutioncache.SolutionCache(args.cache, max_bytes)
+        # the options which can change the solution found, which it is cached under along with the engine
+        search_options = {
+            'astar': dict(prune=args.prune, patterns=args.patterns),
+            'idastar': dict(prune=args.prune, patterns=args.patterns, table_mb=args.table_mb),
+            'anytime': dict(time_budget=args.time_budget, prune=args.prune, patterns=args.patterns),
+        }
+        search = solutioncache.search_key(args.engine, **search_options.get(args.engine, {}))
+
+    stats = collections.Counter()
+
+    monitor = None
+    hooks = []
+    if args.progress:
+        hooks.append(telemetry.stderr_hook)
+    if args.stats_file:
+        hooks.append(telemetry.JsonLinesHook(open(args.stats_file, 'w')))
+    if hooks:
+        monitor = telemetry.Monitor(stats, hooks, args.stats_interval)
+
+    moves = cache.get(state, search) if cache else None
+    if moves is None:
+        moves = engines()[args.engine](state, stats, monitor=monitor, **options.get(args.engine, {}))
+        if cache and moves is not None:
+            cache.put(state, search, moves)
+    if monitor is not None:
+        monitor.emit()
+
+    print >>sys.stderr, "states expanded: {}".format(stats['expanded'])
+    print >>sys.stderr, "pushes pruned as deadlocks: {}".format(stats['pruned'])
+
+    if moves is None:
         print "no solution found"
     else:
         print "solution: "
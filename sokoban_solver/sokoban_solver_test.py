@@ -0,0 +1,887 @@
+import collections
+import os
+import resource
+import shutil
+import tempfile
+import threading
+import unittest
+from StringIO import StringIO
+import sokoban_solver
+import pushsearch
+import heuristics
+import informed
+import deadlocks
+import bidirectional
+import parallel
+import patterns
+import statestore
+import tablebase
+import external
+import anytime
+import batch
+import daemon
+import pruning
+import benchmark
+import solutioncache
+import telemetry
+import transposition
+import validate
+import vectorized
+
+LEVEL4 = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'level4-map.txt')
+BENCHMARK_LEVELS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark-levels.txt')
+
+
+SMALL_MAP = """
+######
+#    #
+# X  #
+#    #
+######
+
+######
+#    #
+#  B #
+#   *#
+######
+"""
+
+TWO_BOX_MAP = """
+#######
+#     #
+# X X #
+#  #  #
+#     #
+#######
+
+#######
+#     #
+#     #
+# B#B #
+#  *  #
+#######
+"""
+
+MEDIUM_MAP = """
+########
+#      #
+# X  X #
+#  ##  #
+# X    #
+#      #
+########
+
+########
+#      #
+#  B   #
+#  ##B #
+#   B* #
+#      #
+########
+"""
+
+# the standard notation, with titles; the second level is MEDIUM_MAP
+COLLECTION = """
+; Corners
+  #####
+###   #
+#@$  .#
+#######
+
+Title: Medium
+########
+#      #
+# .$ . #
+#  ##$ #
+# . $@ #
+#      #
+########
+
+########
+# @#   #
+#$ #  .#
+########
+"""
+
+
+def replay(state, moves):
+    """ apply moves to state, checking each one is legal, returning (final state, push count) """
+    pushes = 0
+    for direction in moves:
+        assert state.can_move(direction), "illegal move {}".format(direction)
+        new_state = state.move(direction)
+        if new_state.boxes != state.boxes:
+            pushes += 1
+        state = new_state
+    return state, pushes
+
+
+class BoardStateTests(unittest.TestCase):
+    def setUp(self):
+        self.state = sokoban_solver.read_board(StringIO(SMALL_MAP))
+
+    def test_read_board(self):
+        self.assertEqual(self.state.person_location, (3, 4))
+        self.assertEqual(self.state.box_locations, frozenset([(2, 3)]))
+        self.assertEqual(self.state.target_locations, frozenset([(2, 2)]))
+
+    def test_neighbour_tables_stop_at_walls(self):
+        level = self.state.level
+        self.assertEqual(level.neighbours['D'][self.state.person], None)
+        self.assertEqual(level.neighbours['R'][self.state.person], None)
+        self.assertEqual(level.cells[level.neighbours['U'][self.state.person]], (2, 4))
+
+    def test_push(self):
+        s = self.state.move('U')
+        self.assertTrue(s.can_move('L'))
+        s = s.move('L').move('L')
+        self.assertEqual(s.person_location, (2, 2))
+        self.assertEqual(s.box_locations, frozenset([(2, 1)]))
+        self.assertFalse(s.can_move('L'))
+
+    def test_states_hash_by_person_and_boxes(self):
+        s = self.state.move('L').move('R')
+        self.assertEqual(s, self.state)
+        self.assertEqual(hash(s), hash(self.state))
+        self.assertNotEqual(s.move('U'), self.state.move('L'))
+
+    def test_zobrist_hash_is_updated_incrementally(self):
+        start = self.state.zobrist
+        s = self.state.move('U').move('L').move('D').move('L')
+        fresh = sokoban_solver.BoardState(s.level, s.person, s.boxes)
+        # a state made without a hash only works it out when it's asked for
+        self.assertEqual(fresh.move('U')._zobrist, None)
+        self.assertEqual(s.zobrist, fresh.zobrist)
+        self.assertEqual(start, self.state.zobrist)
+        self.assertNotEqual(s.zobrist, self.state.zobrist)
+
+    def test_is_solved(self):
+        self.assertFalse(self.state.is_solved())
+        self.assertTrue(self.state.move('U').move('L').is_solved())
+
+
+class EngineTests(unittest.TestCase):
+    def setUp(self):
+        self.state = sokoban_solver.read_board(StringIO(TWO_BOX_MAP))
+
+    def test_bfs(self):
+        stats = collections.Counter()
+        moves = sokoban_solver.solve_bfs(self.state, stats)
+        self.assertTrue(replay(self.state, moves)[0].is_solved())
+        self.assertEqual(len(moves), 6)
+        self.assertTrue(stats['expanded'] > 0)
+
+    def test_parallel_bfs_matches_serial(self):
+        state = sokoban_solver.read_board(StringIO(MEDIUM_MAP))
+        serial = sokoban_solver.solve_bfs(state, collections.Counter())
+        for workers in (1, 3):
+            stats = collections.Counter()
+            self.assertEqual(parallel.solve(state, stats, workers), serial)
+            self.assertTrue(stats['worker_peak_rss_kb'] > 0)
+        self.assertEqual(parallel.solve(self.state.move('L').move('U').move('U'), collections.Counter(), 2), None)
+
+    def test_external_bfs_finds_fewest_moves(self):
+        state = sokoban_solver.read_board(StringIO(MEDIUM_MAP))
+        fewest = len(sokoban_solver.solve_bfs(state, collections.Counter()))
+        for window in (0, 2):
+            moves = external.solve(state, collections.Counter(), window=window, chunk=16)
+            self.assertTrue(replay(state, moves)[0].is_solved())
+            self.assertEqual(len(moves), fewest)
+        self.assertEqual(external.solve(self.state.move('L').move('U').move('U'), collections.Counter()), None)
+
+    def test_external_bfs_counts_deadlocks_once(self):
+        state = sokoban_solver.read_board(StringIO(MEDIUM_MAP))
+        workdir = tempfile.mkdtemp(prefix='sokoban-test-')
+        stats = collections.Counter()
+        search = external.ExternalSearch(state, stats, workdir, 0, 16)
+        moves = search.solve(state)
+        pruned = stats['pruned']
+        self.assertTrue(pruned > 0)
+        final, _ = replay(state, moves)
+        # finding the moves again, as solve() did, leaves the count alone
+        self.assertEqual(search.moves_to(search.record(final.person, final.boxes)), moves)
+        self.assertEqual(stats['pruned'], pruned)
+        shutil.rmtree(workdir)
+
+    def test_external_bfs_open_files(self):
+        # level4 is 170 layers deep, and a file open for each of them wouldn't do
+        state = sokoban_solver.read_board(open(LEVEL4))
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (64, hard))
+        try:
+            moves = external.solve(state, collections.Counter())
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+        self.assertEqual(len(moves), 170)
+
+    @unittest.skipIf(vectorized.np is None, "numpy is not installed")
+    def test_vectorized_bfs_finds_fewest_moves(self):
+        for state in (sokoban_solver.read_board(StringIO(MEDIUM_MAP)), sokoban_solver.read_board(open(LEVEL4))):
+            fewest = len(sokoban_solver.solve_bfs(state, collections.Counter()))
+            moves = vectorized.solve(state, collections.Counter())
+            self.assertTrue(replay(state, moves)[0].is_solved())
+            self.assertEqual(len(moves), fewest)
+        self.assertEqual(vectorized.solve(self.state.move('L').move('U').move('U'), collections.Counter()), None)
+
+    def test_push_search_finds_fewest_pushes(self):
+        stats = collections.Counter()
+        moves = pushsearch.solve(self.state, stats)
+        final, pushes = replay(self.state, moves)
+        self.assertTrue(final.is_solved())
+        self.assertEqual(pushes, 2)
+
+    def test_push_search_unsolvable(self):
+        state = self.state.move('L').move('U').move('U')
+        self.assertEqual(pushsearch.solve(state, collections.Counter()), None)
+
+    def test_regions_normalise_person_position(self):
+        level = self.state.level
+        here, _ = pushsearch.normalise(level, self.state.person, self.state.boxes)
+        there, _ = pushsearch.normalise(level, self.state.move('R').person, self.state.boxes)
+        self.assertEqual(here, there)
+
+    def test_informed_engines_find_fewest_pushes(self):
+        state = sokoban_solver.read_board(StringIO(MEDIUM_MAP))
+        fewest = replay(state, pushsearch.solve(state, collections.Counter()))[1]
+        for engine in (informed.solve_astar, informed.solve_idastar):
+            final, pushes = replay(state, engine(state, collections.Counter()))
+            self.assertTrue(final.is_solved())
+            self.assertEqual(pushes, fewest)
+
+    def test_bidirectional_finds_fewest_pushes(self):
+        state = sokoban_solver.read_board(StringIO(MEDIUM_MAP))
+        fewest = replay(state, pushsearch.solve(state, collections.Counter()))[1]
+        final, pushes = replay(state, bidirectional.solve(state, collections.Counter()))
+        self.assertTrue(final.is_solved())
+        self.assertEqual(pushes, fewest)
+
+    def test_bidirectional_unsolvable(self):
+        state = self.state.move('L').move('U').move('U')
+        self.assertEqual(bidirectional.solve(state, collections.Counter()), None)
+
+    def test_anytime_solutions_improve_to_fewest_pushes(self):
+        levels = dict(sokoban_solver.read_levels(open(BENCHMARK_LEVELS)))
+        state = levels['Cross']
+        pushes = [replay(state, moves)[1] for moves in anytime.solutions(state, collections.Counter())]
+        self.assertTrue(len(pushes) > 1)
+        self.assertEqual(pushes, sorted(set(pushes), reverse=True))
+        self.assertEqual(pushes[-1], replay(state, informed.solve_astar(state, collections.Counter()))[1])
+        reported = []
+        moves = anytime.solve(state, collections.Counter(), report=reported.append)
+        self.assertEqual(moves, reported[-1])
+
+    def test_anytime_time_budget(self):
+        # the greedy search's solution comes however short the budget, but nothing after it
+        state = sokoban_solver.read_board(open(LEVEL4))
+        found = list(anytime.solutions(state, collections.Counter(), time_budget=0.01))
+        self.assertEqual(len(found), 1)
+        self.assertTrue(replay(state, found[0])[0].is_solved())
+
+    def test_goal_states_cover_each_region(self):
+        # with its boxes on the targets, level4 is split into a left and a right half
+        level = sokoban_solver.read_board(open(LEVEL4)).level
+        regions = [level.cells[region] for _, region in pushsearch.goal_states(level)]
+        self.assertEqual(regions, [(1, 2), (1, 4)])
+
+    def test_informed_engines_unsolvable(self):
+        state = self.state.move('L').move('U').move('U')
+        for engine in (informed.solve_astar, informed.solve_idastar):
+            self.assertEqual(engine(state, collections.Counter()), None)
+
+
+class HeuristicTests(unittest.TestCase):
+    def test_min_cost_matching(self):
+        self.assertEqual(heuristics.min_cost_matching([[4, 1, 3], [2, 0, 5], [3, 2, 2]]), 5)
+        self.assertEqual(heuristics.min_cost_matching([]), 0)
+
+    def test_matching_lower_bound(self):
+        state = sokoban_solver.read_board(StringIO(TWO_BOX_MAP))
+        self.assertEqual(heuristics.matching_lower_bound(state.level, state.boxes), 2)
+        stuck = state.move('L').move('U').move('U')
+        self.assertEqual(heuristics.matching_lower_bound(state.level, stuck.boxes), None)
+
+
+OPEN_MAP = """
+#######
+#     #
+#     #
+# XX  #
+# XX  #
+#     #
+#######
+
+#######
+#     #
+# B   #
+#  BB #
+#  B  #
+#  *  #
+#######
+"""
+
+
+class DeadlockTests(unittest.TestCase):
+    def setUp(self):
+        self.state = sokoban_solver.read_board(StringIO(OPEN_MAP))
+        self.level = self.state.level
+
+    def test_dead_squares(self):
+        dead = self.level.unpack(deadlocks.dead_squares(self.level))
+        self.assertTrue((1, 1) in dead)
+        self.assertTrue((5, 5) in dead)
+        self.assertTrue((2, 5) in dead)
+        self.assertFalse((2, 2) in dead)
+        self.assertFalse((3, 2) in dead)
+
+    def test_push_onto_dead_square(self):
+        boxes = self.level.pack([(1, 3)])
+        self.assertTrue(deadlocks.is_deadlock(self.level, boxes, self.level.cell_index[(1, 3)]))
+
+    def test_freeze_deadlock(self):
+        # pushing the lower box left completes a 2x2 block, which is only fine if all on targets
+        block = [(3, 3), (3, 4), (4, 3), (4, 4)]
+        self.assertTrue(deadlocks.is_deadlock(self.level, self.level.pack(block), self.level.cell_index[(4, 3)]))
+        on_targets = [(3, 2), (3, 3), (4, 2), (4, 3)]
+        self.assertFalse(deadlocks.is_deadlock(self.level, self.level.pack(on_targets),
+                                               self.level.cell_index[(4, 3)]))
+
+    def test_unfrozen_group(self):
+        boxes = self.level.pack([(3, 3), (3, 4), (4, 3)])
+        self.assertFalse(deadlocks.is_deadlock(self.level, boxes, self.level.cell_index[(4, 3)]))
+
+    def test_pruned_pushes_are_counted(self):
+        state = sokoban_solver.read_board(StringIO(TWO_BOX_MAP))
+        stats = collections.Counter()
+        self.assertTrue(replay(state, pushsearch.solve(state, stats))[0].is_solved())
+        self.assertTrue(stats['pruned'] > 0)
+
+
+class PruningTests(unittest.TestCase):
+    def pushes(self, rows):
+        state = sokoban_solver.read_xsb(rows)
+        level = state.level
+        reached = pushsearch.reachable(level, state.person, state.boxes)
+        return [(level.cells[box_cell], direction, level.cells[to_cell], count)
+                for box_cell, direction, to_cell, count in pruning.pruned_pushes(level, state.boxes, reached)]
+
+    def test_tunnel_macro(self):
+        self.assertEqual(self.pushes(['#########', '#@$    .#', '#########']), [((1, 2), 'R', (1, 7), 5)])
+        # stopping at a target on the way, and at the end of the tunnel
+        self.assertEqual(self.pushes(['#########', '#@$ .   #', '#########']), [((1, 2), 'R', (1, 4), 2)])
+        self.assertEqual(self.pushes(['#########', '#@$   . #', '####### #', '      #.#', '      ###']),
+                         [((1, 2), 'R', (1, 6), 4)])
+
+    def test_pi_corral(self):
+        rows = ['#######',
+                '#@  $.#',
+                '# $ $ #',
+                '#   $ #',
+                '#######']
+        state = sokoban_solver.read_xsb(rows)
+        level = state.level
+        boundary, cells = pruning.pi_corral(level, state.boxes, pushsearch.reachable(level, state.person, state.boxes))
+        self.assertEqual(sorted(level.cells[cell] for cell in boundary), [(1, 4), (2, 4), (3, 4)])
+        self.assertEqual(level.unpack(cells), set([(1, 5), (2, 5), (3, 5)]))
+        # only pushes into the corral are left, less the one into its dead corner
+        self.assertEqual(sorted(self.pushes(rows)), [((1, 4), 'R', (1, 5), 1), ((2, 4), 'R', (2, 5), 1)])
+
+    def test_no_corral_once_it_is_done(self):
+        state = sokoban_solver.read_xsb(['#######', '#@  * #', '# $ * #', '#   * #', '#######'])
+        level = state.level
+        self.assertEqual(pruning.pi_corral(level, state.boxes, pushsearch.reachable(level, state.person, state.boxes)),
+                         None)
+
+    def test_pruned_informed_engines_find_fewest_pushes(self):
+        for state in (sokoban_solver.read_board(StringIO(MEDIUM_MAP)), sokoban_solver.read_board(open(LEVEL4))):
+            fewest = replay(state, informed.solve_astar(state, collections.Counter()))[1]
+            final, pushes = replay(state, informed.solve_astar(state, collections.Counter(), prune=True))
+            self.assertTrue(final.is_solved())
+            self.assertEqual(pushes, fewest)
+        state = sokoban_solver.read_xsb(['#########', '#@$    .#', '#########'])
+        stats = collections.Counter()
+        self.assertEqual(informed.solve_idastar(state, stats, prune=True), list('RRRRR'))
+        self.assertEqual(stats['expanded'], 2)
+
+
+class PatternTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='sokoban-test-')
+        self.path = os.path.join(self.directory, 'level.pdb')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def database(self, state, size, combine='add'):
+        patterns.write(self.path, state.level, size, patterns.build(state.level, size))
+        return patterns.PatternDatabase(self.path, state.level, combine)
+
+    def test_entries(self):
+        state = sokoban_solver.read_xsb(['#######',
+                                         '#.   .#',
+                                         '#     #',
+                                         '#  @  #',
+                                         '#######'])
+        level = state.level
+        database = self.database(state, 2)
+
+        def entry(*locations):
+            return database.entry(sorted(level.cell_index[location] for location in locations))
+        self.assertEqual(entry((1, 1), (1, 5)), 0)
+        self.assertEqual(entry((1, 2), (1, 4)), 2)
+        self.assertEqual(entry((2, 2), (2, 4)), 4)
+        # against the wall, each box is in the other's way
+        self.assertEqual(entry((1, 2), (1, 3)), None)
+        database.close()
+
+    def test_informed_engines_find_fewest_pushes(self):
+        for state in (sokoban_solver.read_board(StringIO(MEDIUM_MAP)), sokoban_solver.read_board(open(LEVEL4))):
+            stats = collections.Counter()
+            fewest = replay(state, informed.solve_astar(state, stats))[1]
+            for size, combine in ((2, 'add'), (3, 'max')):
+                database = self.database(state, size, combine)
+                self.assertTrue(database.lower_bound(state.boxes) <= fewest)
+                pdb_stats = collections.Counter()
+                final, pushes = replay(state, informed.solve_astar(state, pdb_stats, patterns=database))
+                self.assertTrue(final.is_solved())
+                self.assertEqual(pushes, fewest)
+                self.assertTrue(pdb_stats['expanded'] <= stats['expanded'])
+                database.close()
+
+    def test_other_level_is_refused(self):
+        self.database(sokoban_solver.read_board(StringIO(MEDIUM_MAP)), 2).close()
+        self.assertRaises(Exception, patterns.PatternDatabase, self.path,
+                          sokoban_solver.read_board(StringIO(TWO_BOX_MAP)).level)
+
+
+class CheckpointTests(unittest.TestCase):
+    class Killed(Exception):
+        pass
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='sokoban-test-')
+        self.path = os.path.join(self.directory, 'search.ckp')
+        self.state = sokoban_solver.read_board(open(LEVEL4))
+        self.stats = collections.Counter()
+        self.moves = sokoban_solver.solve_bfs(self.state, self.stats)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def kill_after(self, expanded):
+        """ a monitor which stops the search once it has expanded that many states """
+        test = self
+
+        class Killer(object):
+            def update(self, *progress):
+                if stats['expanded'] >= expanded:
+                    raise test.Killed()
+        stats = collections.Counter()
+        self.assertRaises(self.Killed, sokoban_solver.solve_bfs, self.state, stats, monitor=Killer(),
+                          checkpoint=self.path, checkpoint_interval=0)
+
+    def test_resume(self):
+        self.kill_after(30000)
+        stats = collections.Counter()
+        records = []
+        monitor = telemetry.Monitor(stats, [records.append], interval=0)
+        moves = sokoban_solver.solve_bfs(self.state, stats, monitor=monitor, checkpoint=self.path, resume=True)
+        self.assertEqual(moves, self.moves)
+        self.assertEqual(stats, self.stats)
+        # only what was left was searched
+        self.assertTrue(records[0]['expanded'] > 29000)
+
+    def test_resume_after_a_torn_write(self):
+        self.kill_after(30000)
+        with open(self.path, 'r+b') as f:
+            f.seek(-10, os.SEEK_END)
+            f.truncate()
+        stats = collections.Counter()
+        self.assertEqual(sokoban_solver.solve_bfs(self.state, stats, checkpoint=self.path, resume=True), self.moves)
+        self.assertEqual(stats, self.stats)
+
+    def test_fresh_start_without_a_checkpoint(self):
+        stats = collections.Counter()
+        moves = sokoban_solver.solve_bfs(self.state, stats, checkpoint=self.path, checkpoint_interval=0,
+                                         resume=True)
+        self.assertEqual(moves, self.moves)
+        self.assertRaises(Exception, sokoban_solver.solve_bfs, sokoban_solver.read_board(StringIO(MEDIUM_MAP)),
+                          collections.Counter(), checkpoint=self.path, resume=True)
+
+
+class TranspositionTests(unittest.TestCase):
+    def test_replacement(self):
+        # a single bucket
+        table = transposition.TranspositionTable(20, 1)
+        self.assertEqual(len(table), transposition.WAYS)
+        for key in xrange(transposition.WAYS):
+            table.put(key, key, 5, 6, 1)
+        self.assertEqual(table.get(2), (2, 5, 6, 1))
+        # deeper than all of this iteration's, so not kept
+        table.put(100, transposition.WAYS, 5, 6, 1)
+        self.assertEqual(table.get(100), None)
+        # the deepest makes way
+        table.put(100, 0, 7, 8, 1)
+        self.assertEqual(table.get(100), (0, 7, 8, 1))
+        self.assertEqual(table.get(transposition.WAYS - 1), None)
+        # anything from an earlier iteration makes way, the deepest first
+        table.put(0, 0, 5, 6, 2)
+        self.assertEqual(table.get(0), (0, 5, 6, 2))
+        table.put(101, 9, 5, 6, 2)
+        self.assertEqual(table.get(2), None)
+        self.assertEqual(table.get(101), (9, 5, 6, 2))
+
+    def test_idastar_finds_fewest_pushes(self):
+        levels = dict(sokoban_solver.read_levels(open(BENCHMARK_LEVELS)))
+        stats = collections.Counter()
+        table_stats = collections.Counter()
+        for title in ('Medium', 'Store', 'Five', 'Stack'):
+            state = levels[title]
+            fewest = replay(state, informed.solve_idastar(state, stats, table_mb=0))[1]
+            for table_mb in (0.001, 1):
+                final, pushes = replay(state, informed.solve_idastar(state, table_stats, table_mb=table_mb))
+                self.assertTrue(final.is_solved())
+                self.assertEqual(pushes, fewest, title)
+        # twice over, for the two sizes of table
+        self.assertTrue(table_stats['expanded'] < stats['expanded'] * 2)
+
+    def test_idastar_gives_up_without_a_solution(self):
+        # the matching bound is no help here: A* runs out of states, but the pushes IDA* can go round in
+        # circles with would keep it raising its bound for ever, without the table to show it's got nowhere
+        state = sokoban_solver.read_xsb(['########',
+                                         '#.##  .#',
+                                         '#  @   #',
+                                         '# #  $##',
+                                         '# #  $ #',
+                                         '# #    #',
+                                         '#  #   #',
+                                         '########'])
+        self.assertEqual(informed.solve_astar(state, collections.Counter()), None)
+        stats = collections.Counter()
+        self.assertEqual(informed.solve_idastar(state, stats), None)
+        self.assertTrue(stats['expanded'] < 1000)
+
+
+class TablebaseTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='sokoban-test-')
+        self.path = os.path.join(self.directory, 'level.tb')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def tablebase(self, state):
+        tablebase.write(self.path, state.level, tablebase.build(state.level))
+        return tablebase.Tablebase(self.path, state.level)
+
+    def test_fewest_pushes_from_anywhere(self):
+        for state in (sokoban_solver.read_board(StringIO(MEDIUM_MAP)), sokoban_solver.read_board(open(LEVEL4))):
+            table = self.tablebase(state)
+            fewest = replay(state, pushsearch.solve(state, collections.Counter()))[1]
+            self.assertEqual(table.pushes_left(state), fewest)
+            final, pushes = replay(state, table.solve(state))
+            self.assertTrue(final.is_solved())
+            self.assertEqual(pushes, fewest)
+            # part way through, the hint carries on from there
+            moves = table.hint(state)
+            moved = replay(state, moves)[0]
+            self.assertEqual(table.pushes_left(moved), fewest - 1)
+            self.assertEqual(table.hint(final), None)
+            table.close()
+
+    def test_unsolvable(self):
+        state = sokoban_solver.read_xsb(['#####', '#@$.#', '#$. #', '#####'])
+        table = self.tablebase(state)
+        self.assertEqual(table.pushes_left(state), None)
+        self.assertEqual(table.hint(state), None)
+        self.assertEqual(table.solve(state), None)
+        table.close()
+        self.assertRaises(Exception, tablebase.Tablebase, self.path, sokoban_solver.read_board(StringIO(MEDIUM_MAP)).level)
+
+
+class ValidateTests(unittest.TestCase):
+    def test_replay(self):
+        state = sokoban_solver.read_board(StringIO(MEDIUM_MAP))
+        moves = ''.join(sokoban_solver.solve_bfs(state, collections.Counter()))
+        pushes = replay(state, moves)[1]
+        replayer = validate.Replayer(state)
+        self.assertEqual(replayer.replay(moves), ('valid', None, len(moves), pushes))
+        self.assertEqual(replayer.replay(moves.lower()), ('valid', None, len(moves), pushes))
+        self.assertEqual(replayer.replay(moves[:-1]), ('unsolved', None, len(moves) - 1, pushes - 1))
+        self.assertEqual(replayer.replay(''), ('unsolved', None, 0, 0))
+        self.assertEqual(replayer.replay(moves[:3] + 'x' + moves[3:]), ('illegal', 3, 3, replay(state, moves[:3])[1]))
+
+    def test_illegal_moves(self):
+        replayer = validate.Replayer(sokoban_solver.read_xsb(['######', '#@$$.#', '######']))
+        # into a wall, and pushing two boxes at once
+        self.assertEqual(replayer.replay('LR'), ('illegal', 0, 0, 0))
+        self.assertEqual(replayer.replay('R'), ('illegal', 0, 0, 0))
+
+    def test_validate_all(self):
+        state = sokoban_solver.read_board(StringIO(MEDIUM_MAP))
+        moves = ''.join(sokoban_solver.solve_bfs(state, collections.Counter()))
+        solutions = [moves, moves[:5], 'UUUUUU', moves] * 5
+        results = list(validate.validate_all(state, solutions, processes=2, chunk_size=3))
+        self.assertEqual([result['solution'] for result in results], range(1, 21))
+        self.assertEqual([result['status'] for result in results[:4]], ['valid', 'unsolved', 'illegal', 'valid'])
+        self.assertEqual(results, list(validate.validate_all(state, solutions, processes=1)))
+
+    def test_blank_lines_are_not_solutions(self):
+        self.assertEqual(list(validate.read_solutions(StringIO("RRR\n\n  \nuld\n\n"))), ['RRR', 'uld'])
+
+
+class StateStoreTests(unittest.TestCase):
+    def test_add_and_find(self):
+        store = statestore.StateStore(20, capacity=4)
+        self.assertEqual(store.add(5, statestore.EMPTY, ' '), 0)
+        for i in xrange(1, 100):
+            self.assertEqual(store.add(5 + i * 1024, i - 1, 'UDLR'[i % 4]), i)
+        self.assertEqual(store.add(5 + 1024, 0, 'L'), statestore.EMPTY)
+        self.assertEqual(store.find(5 + 99 * 1024), 99)
+        self.assertEqual(store.find(6), statestore.EMPTY)
+        self.assertEqual(len(store), 100)
+        self.assertEqual(store.path(3), ['D', 'L', 'R'])
+
+    def test_multi_word_keys(self):
+        store = statestore.StateStore(150)
+        keys = [(1 << 149) | i for i in xrange(10)] + [i << 70 for i in xrange(10)]
+        for key in keys:
+            store.add(key, statestore.EMPTY, ' ')
+        self.assertEqual([store.key(store.find(key)) for key in keys], keys)
+
+
+class ReadLevelsTests(unittest.TestCase):
+    def test_read_xsb(self):
+        state = sokoban_solver.read_xsb(['  ####', '###  #', '#+*$ #', '#   .#', '######'])
+        level = state.level
+        self.assertEqual(level.board[0], '  ####')
+        self.assertEqual(state.person_location, (2, 1))
+        self.assertEqual(state.box_locations, set([(2, 2), (2, 3)]))
+        self.assertEqual(state.target_locations, set([(2, 1), (2, 2), (3, 4)]))
+
+    def test_read_levels(self):
+        levels = list(sokoban_solver.read_levels(StringIO(COLLECTION)))
+        self.assertEqual([title for title, _ in levels], ['Corners', 'Medium', '3'])
+        medium = sokoban_solver.read_board(StringIO(MEDIUM_MAP))
+        self.assertEqual(levels[1][1], medium)
+        self.assertEqual(levels[1][1].target_locations, medium.target_locations)
+
+    def test_read_levels_two_board_format(self):
+        levels = list(sokoban_solver.read_levels(StringIO(SMALL_MAP + "\n; next\n" + TWO_BOX_MAP)))
+        self.assertEqual([title for title, _ in levels], ['1', 'next'])
+        self.assertEqual(levels[0][1], sokoban_solver.read_board(StringIO(SMALL_MAP)))
+        self.assertEqual(levels[1][1], sokoban_solver.read_board(StringIO(TWO_BOX_MAP)))
+
+
+class BatchTests(unittest.TestCase):
+    def test_solve_all(self):
+        levels = sokoban_solver.read_levels(StringIO(COLLECTION))
+        results = list(batch.solve_all(levels, processes=2))
+        self.assertEqual([result['level'] for result in results], [1, 2, 3])
+        self.assertEqual([result['status'] for result in results], ['solved', 'solved', 'unsolvable'])
+        self.assertEqual(results[0]['moves'], 'RRR')
+        self.assertEqual(results[0]['pushes'], 3)
+        self.assertEqual(results[1]['move_count'], 12)
+        self.assertEqual(results[1]['pushes'], 4)
+        self.assertTrue(results[1]['expanded'] > 0)
+        self.assertEqual(results[2]['moves'], None)
+
+    def test_unreadable_level(self):
+        corners, medium, _ = COLLECTION.split('\n\n')
+        collection = '\n\n'.join([corners, "; No person\n#####\n# $.#\n#####", medium])
+        with self.assertRaises(Exception):
+            list(sokoban_solver.read_levels(StringIO(collection)))
+        levels = sokoban_solver.read_levels(StringIO(collection), errors=True)
+        results = list(batch.solve_all(levels, processes=2))
+        self.assertEqual([result['status'] for result in results], ['solved', 'error', 'solved'])
+        self.assertEqual(results[1]['title'], 'No person')
+        self.assertTrue('no person' in results[1]['error'])
+
+    def test_timeout(self):
+        levels = sokoban_solver.read_levels(open(LEVEL4))
+        results = list(batch.solve_all(levels, engine='idastar', timeout=0.2))
+        self.assertEqual([result['status'] for result in results], ['timeout'])
+
+
+class BenchmarkTests(unittest.TestCase):
+    def test_run(self):
+        levels = list(sokoban_solver.read_levels(StringIO(COLLECTION)))[:2]
+        results = list(benchmark.run(levels, ['push', 'bfs']))
+        self.assertEqual([(result['engine'], result['title']) for result in results],
+                         [('push', 'Corners'), ('push', 'Medium'), ('bfs', 'Corners'), ('bfs', 'Medium')])
+        self.assertEqual(results[3]['move_count'], 12)
+        self.assertTrue(results[3]['peak_rss_kb'] > 0)
+
+    def test_compare(self):
+        def result(title, status='solved', seconds=1.0, peak_rss_kb=10000, move_count=10):
+            return dict(engine='bfs', title=title, status=status, seconds=seconds, peak_rss_kb=peak_rss_kb,
+                        move_count=move_count, pushes=2)
+        baseline = {'results': [result('a'), result('b'), result('c'), result('d'), result('e')]}
+        current = {'results': [result('a', seconds=1.2), result('b', seconds=2.0), result('c', status='timeout'),
+                               result('d', peak_rss_kb=20000), result('e', move_count=12), result('f')]}
+        self.assertEqual([(title, what.split()[0]) for _, title, what in benchmark.compare(current, baseline)],
+                         [('b', '2.000s,'), ('c', 'timeout'), ('d', 'peak'), ('e', 'move_count')])
+
+
+class TelemetryTests(unittest.TestCase):
+    def test_engines_report_progress(self):
+        state = sokoban_solver.read_board(StringIO(MEDIUM_MAP))
+        for name, engine in sorted(sokoban_solver.engines().items()):
+            if name == 'vectorized' and vectorized.np is None:
+                continue
+            stats = collections.Counter()
+            records = []
+            monitor = telemetry.Monitor(stats, [records.append], interval=0)
+            moves = engine(state, stats, monitor=monitor)
+            monitor.emit()
+            self.assertTrue(records, name)
+            last = records[-1]
+            self.assertEqual(last['expanded'], stats['expanded'], name)
+            self.assertTrue(0 <= last['duplicate_rate'] < 1, name)
+            if name in ('bfs', 'parallel', 'external'):
+                self.assertEqual(last['depth'], len(moves), name)
+
+    def test_json_lines_hook(self):
+        out = StringIO()
+        telemetry.JsonLinesHook(out)({'depth': 3, 'visited': 10})
+        self.assertEqual(out.getvalue(), '{"depth": 3, "visited": 10}\n')
+
+
+def walled(grid):
+    """ grid with walls around it, and floor outside the walls """
+    wall = '   ' + '#' * (len(grid[0]) + 2)
+    return [wall] + ['   #' + row + '#  ' for row in grid] + [wall, '']
+
+
+class SolutionCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(prefix='sokoban-test-'), 'cache.db')
+        self.state = sokoban_solver.read_board(StringIO(MEDIUM_MAP))
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.path))
+
+    def test_symmetries_and_trimmed_walls_share_a_key(self):
+        rows = solutioncache.trimmed_rows(self.state)
+        key, _ = solutioncache.canonical(self.state)
+        for grid, _ in solutioncache.symmetries(rows):
+            self.assertEqual(solutioncache.canonical(sokoban_solver.read_xsb(walled(grid)))[0], key)
+
+    def test_moves_are_mapped_to_each_orientation(self):
+        cache = solutioncache.SolutionCache(self.path)
+        self.assertEqual(cache.get(self.state, 'bfs'), None)
+        moves = sokoban_solver.solve_bfs(self.state, collections.Counter())
+        cache.put(self.state, 'bfs', moves)
+        self.assertEqual(cache.get(self.state, 'bfs'), moves)
+        self.assertEqual(cache.get(self.state, 'push'), None)
+        for grid, _ in solutioncache.symmetries(solutioncache.trimmed_rows(self.state)):
+            state = sokoban_solver.read_xsb(walled(grid))
+            final, _ = replay(state, cache.get(state, 'bfs'))
+            self.assertTrue(final.is_solved())
+        cache.close()
+
+    def test_search_options_are_kept_apart(self):
+        self.assertEqual(solutioncache.search_key('anytime', time_budget=None, prune=False), 'anytime')
+        cut_short = solutioncache.search_key('anytime', time_budget=0.5)
+        self.assertNotEqual(cut_short, 'anytime')
+        self.assertNotEqual(solutioncache.search_key('astar', prune=True), solutioncache.search_key('astar'))
+        cache = solutioncache.SolutionCache(self.path)
+        cache.put(self.state, cut_short, ['L'])
+        self.assertEqual(cache.get(self.state, 'anytime'), None)
+        self.assertEqual(cache.get(self.state, cut_short), ['L'])
+        cache.close()
+
+    def test_least_recently_used_are_evicted(self):
+        states = [sokoban_solver.read_board(StringIO(m)) for m in (SMALL_MAP, TWO_BOX_MAP, MEDIUM_MAP)]
+        cache = solutioncache.SolutionCache(self.path, max_bytes=2 * (40 + solutioncache.ENTRY_OVERHEAD) + 20)
+        cache.put(states[0], 'bfs', ['L'])
+        cache.put(states[1], 'bfs', ['U'])
+        cache.get(states[0], 'bfs')
+        cache.put(states[2], 'bfs', ['D'])
+        self.assertEqual(cache.get(states[1], 'bfs'), None)
+        self.assertEqual(cache.get(states[0], 'bfs'), ['L'])
+        self.assertEqual(cache.get(states[2], 'bfs'), ['D'])
+        cache.close()
+
+    def test_batch_uses_cache(self):
+        cache = solutioncache.SolutionCache(self.path)
+        first = list(batch.solve_all(sokoban_solver.read_levels(StringIO(COLLECTION)), cache=cache))
+        again = list(batch.solve_all(sokoban_solver.read_levels(StringIO(COLLECTION)), cache=cache))
+        self.assertEqual([result['moves'] for result in again], [result['moves'] for result in first])
+        self.assertEqual(again[1]['expanded'], 0)
+        cache.close()
+
+
+class DaemonTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='sokoban-test-')
+        self.address = os.path.join(self.directory, 'socket')
+        self.solver = daemon.Solver(processes=1)
+        self.server = daemon.serve(self.address, self.solver)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.solver.close()
+        shutil.rmtree(self.directory)
+
+    def test_solves_and_caches(self):
+        medium = COLLECTION.split('\n\n')[1]
+        answer = daemon.ask(self.address, medium)
+        self.assertEqual((answer['status'], answer['move_count'], answer['pushes']), ('solved', 12, 4))
+        self.assertFalse(answer['cached'])
+        self.assertTrue(answer['expanded'] > 0)
+
+        again = daemon.ask(self.address, medium)
+        self.assertTrue(again['cached'])
+        self.assertEqual(again['moves'], answer['moves'])
+        self.assertFalse(daemon.ask(self.address, medium, engine='astar')['cached'])
+
+        # the same level turned upside down is answered from the cache, with its own moves
+        flipped = '\n'.join(reversed(medium.split('\n')[1:]))
+        turned = daemon.ask(self.address, flipped)
+        self.assertTrue(turned['cached'])
+        final, _ = replay(sokoban_solver.read_xsb(flipped.split('\n')), turned['moves'])
+        self.assertTrue(final.is_solved())
+
+    def test_errors(self):
+        self.assertEqual(daemon.ask(self.address, MEDIUM_MAP, engine='nonesuch')['status'], 'error')
+        self.assertEqual(daemon.ask(self.address, COLLECTION)['status'], 'error')
+        answer = daemon.ask(self.address, MEDIUM_MAP, unknown_option=1)
+        self.assertEqual(answer['status'], 'error')
+        self.assertTrue('unknown_option' in answer['error'])
+        self.assertEqual(daemon.ask(self.address, MEDIUM_MAP, engine='parallel')['status'], 'error')
+        self.assertEqual(daemon.ask(self.address, MEDIUM_MAP, engine='astar', prune='yes')['status'], 'error')
+
+    def test_no_paths_in_options(self):
+        target = os.path.join(self.directory, 'target')
+        with open(target, 'w') as f:
+            f.write('precious')
+        for engine, name in (('bfs', 'checkpoint'), ('external', 'workdir'), ('astar', 'patterns')):
+            answer = daemon.ask(self.address, MEDIUM_MAP, engine=engine, **{name: target})
+            self.assertEqual(answer['status'], 'error')
+            self.assertTrue(name in answer['error'])
+        with open(target) as f:
+            self.assertEqual(f.read(), 'precious')
+        self.assertEqual(daemon.ask(self.address, MEDIUM_MAP, engine='idastar', prune=True, table_mb=1)['status'],
+                         'solved')
+
+    def test_timeout(self):
+        with open(LEVEL4) as f:
+            level4 = f.read()
+        answer = daemon.ask(self.address, level4, timeout=0.2)
+        self.assertEqual((answer['status'], answer['moves']), ('timeout', None))
+        self.assertEqual(daemon.ask(self.address, MEDIUM_MAP, timeout='soon')['status'], 'error')
+        # the worker that was killed has been replaced
+        self.assertEqual(daemon.ask(self.address, MEDIUM_MAP, timeout=60)['status'], 'solved')
+
+    def test_workers_keep_levels(self):
+        level = sokoban_solver.read_board(StringIO(MEDIUM_MAP)).level
+        self.assertTrue(daemon._warm_level(level.board, level.target_locations) is
+                        daemon._warm_level(level.board, level.target_locations))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+# A persistent cache of solutions for the sokoban solver, in an SQLite file.
+#
+# Levels are looked up by a canonical form of their starting position, so
+# that a copy of a level that is rotated or reflected, or drawn with more or
+# fewer walls around the outside, finds the same entry:
+#
+#  - every square the person can't reach (ignoring boxes) is taken as a wall,
+#    unless it holds a box or a target, and the grid is cropped to the squares
+#    left, which trims away the outer walls
+#  - of the 8 rotations and reflections of that grid, the least as a string
+#    is the canonical one, and its SHA-1 is the level's key
+#
+# Solutions are stored as moves in the canonical orientation, and mapped back
+# to the orientation of the level being solved when they are read.  As the
+# engines differ in what they minimise, entries are kept per engine, and per
+# any options which can change the solution found (see search_key) - a run of
+# the anytime engine cut short by its time budget mustn't answer for one that
+# wasn't.
+#
+# Each entry records when it was last used, and once the entries come to more
+# than a given size the least recently used are evicted.
+
+import hashlib
+import json
+import sqlite3
+
+# the moves in each direction after a transposition, a flip upside down and a flip left to right
+TRANSPOSED = {'U': 'L', 'D': 'R', 'L': 'U', 'R': 'D'}
+FLIPPED_ROWS = {'U': 'D', 'D': 'U', 'L': 'L', 'R': 'R'}
+FLIPPED_COLUMNS = {'U': 'U', 'D': 'D', 'L': 'R', 'R': 'L'}
+
+# rough size of an entry, beyond its key and moves, for eviction
+ENTRY_OVERHEAD = 64
+
+
+def search_key(engine, **options):
+    """
+    the name solutions found by engine with options are kept under: the engine's own name, if the options
+    are all None or False, as they are by default, or else the engine and the options given, as JSON
+    """
+    options = dict((name, value) for name, value in options.items() if value is not None and value is not False)
+    if not options:
+        return engine
+    return json.dumps([engine, options], sort_keys=True)
+
+
+def _interior(level, person):
+    """ the cells the person could reach if there were no boxes """
+    seen = set([person])
+    stack = [person]
+    while stack:
+        cell = stack.pop()
+        for next_cell in level.adjacent[cell]:
+            if next_cell not in seen:
+                seen.add(next_cell)
+                stack.append(next_cell)
+    return seen
+
+
+def _square(state, cell):
+    level = state.level
+    bit = level.bits[cell]
+    on_target = level.targets & bit
+    if cell == state.person:
+        return '+' if on_target else '@'
+    if state.boxes & bit:
+        return '*' if on_target else '$'
+    return '.' if on_target else ' '
+
+
+def trimmed_rows(state):
+    """ the level as rows in the standard notation, with the squares the person can't get to left out """
+    level = state.level
+    kept = _interior(level, state.person)
+    kept.update(level.indexes(state.boxes | level.targets))
+    locations = [level.cells[cell] for cell in kept]
+    top = min(r for r, _ in locations)
+    left = min(c for _, c in locations)
+    height = max(r for r, _ in locations) - top + 1
+    width = max(c for _, c in locations) - left + 1
+
+    grid = [['#'] * width for _ in xrange(height)]
+    for cell in kept:
+        r, c = level.cells[cell]
+        grid[r - top][c - left] = _square(state, cell)
+    return [''.join(row) for row in grid]
+
+
+def symmetries(rows):
+    """
+    generates (rows, directions) for the 8 rotations and reflections of rows, where directions
+    maps a move on the original rows to the same move on the transformed ones
+    """
+    for transpose in (False, True):
+        for flip_rows in (False, True):
+            for flip_columns in (False, True):
+                grid = rows
+                directions = dict((d, d) for d in TRANSPOSED)
+                if transpose:
+                    grid = [''.join(row[c] for row in grid) for c in xrange(len(grid[0]))]
+                    directions = dict((d, TRANSPOSED[m]) for d, m in directions.items())
+                if flip_rows:
+                    grid = grid[::-1]
+                    directions = dict((d, FLIPPED_ROWS[m]) for d, m in directions.items())
+                if flip_columns:
+                    grid = [row[::-1] for row in grid]
+                    directions = dict((d, FLIPPED_COLUMNS[m]) for d, m in directions.items())
+                yield grid, directions
+
+
+def canonical(state):
+    """ (key, directions) for a level, where directions maps its moves to the canonical orientation """
+    options = [('\n'.join(grid), directions) for grid, directions in symmetries(trimmed_rows(state))]
+    text, directions = min(options, key=lambda option: option[0])
+    return hashlib.sha1(text).hexdigest(), directions
+
+
+class SolutionCache(object):
+    """ solutions by canonical level and engine, in an SQLite file at path, of at most max_bytes if given """
+
+    def __init__(self, path, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute("CREATE TABLE IF NOT EXISTS solutions ("
+                        "key TEXT NOT NULL, engine TEXT NOT NULL, moves TEXT NOT NULL, "
+                        "size INTEGER NOT NULL, used INTEGER NOT NULL, PRIMARY KEY (key, engine))")
+        self.db.execute("CREATE INDEX IF NOT EXISTS solutions_used ON solutions (used)")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def _tick(self):
+        """ a count which goes up on each use, for the least recently used order """
+        return self.db.execute("SELECT COALESCE(MAX(used), 0) + 1 FROM solutions").fetchone()[0]
+
+    def get(self, state, engine):
+        """ the cached list of moves solving state's level with engine, or None """
+        key, directions = canonical(state)
+        row = self.db.execute("SELECT moves FROM solutions WHERE key = ? AND engine = ?", (key, engine)).fetchone()
+        if row is None:
+            return None
+        self.db.execute("UPDATE solutions SET used = ? WHERE key = ? AND engine = ?", (self._tick(), key, engine))
+        self.db.commit()
+        back = dict((m, d) for d, m in directions.items())
+        return [back[m] for m in row[0]]
+
+    def put(self, state, engine, moves):
+        """ caches the list of moves solving state's level with engine """
+        key, directions = canonical(state)
+        stored = ''.join(directions[d] for d in moves)
+        self.db.execute("INSERT OR REPLACE INTO solutions (key, engine, moves, size, used) VALUES (?, ?, ?, ?, ?)",
+                        (key, engine, stored, len(key) + len(stored) + ENTRY_OVERHEAD, self._tick()))
+        self.evict()
+        self.db.commit()
+
+    def size(self):
+        return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM solutions").fetchone()[0]
+
+    def evict(self):
+        """ drops the least recently used entries until the rest fit in max_bytes """
+        if self.max_bytes is None:
+            return
+        excess = self.size() - self.max_bytes
+        if excess <= 0:
+            return
+        doomed = []
+        for key, engine, size in self.db.execute("SELECT key, engine, size FROM solutions ORDER BY used"):
+            if excess <= 0:
+                break
+            doomed.append((key, engine))
+            excess -= size
+        self.db.executemany("DELETE FROM solutions WHERE key = ? AND engine = ?", doomed)
@@ -0,0 +1,128 @@
+# A compact visited set and parent-pointer store for the breadth-first
+# searches of the sokoban solver.
+#
+# Rather than dicts of state objects, each state is encoded as a fixed-width
+# unsigned int (see Level.encode), split into machine words and appended to
+# array-backed columns, along with the index of its parent and the move that
+# reached it.  An open-addressing hash table of indexes into those columns
+# finds states already seen.  That comes to a few tens of bytes a state.
+#
+# Each state's hash is kept in a column too, so that keys are only compared
+# in full when their hashes match, and growing the table never rehashes.  The
+# hash can be given when adding a state, such as a BoardState's Zobrist hash,
+# and otherwise is hash() of the encoded state.
+#
+# As a breadth-first search adds states in the order it will expand them,
+# the indexes double up as the search queue.
+
+from array import array
+
+WORD_BITS = array('L').itemsize * 8
+WORD_MASK = (1 << WORD_BITS) - 1
+EMPTY = -1
+
+# for Fibonacci hashing - encoded states are very regular in their low bits
+GOLDEN = 0x9E3779B97F4A7C15 & WORD_MASK
+
+
+class StateStore(object):
+
+    def __init__(self, key_bits, capacity=1 << 16):
+        self.words = max(1, (key_bits + WORD_BITS - 1) // WORD_BITS)
+        self.keys = array('L')
+        self.hashes = array('l')
+        self.parents = array('l')
+        self.moves = array('c')
+        self._resize(capacity)
+
+    def __len__(self):
+        return len(self.parents)
+
+    def key(self, index):
+        """ the encoded state stored at index """
+        if self.words == 1:
+            return self.keys[index]
+        key = 0
+        start = index * self.words
+        for word in reversed(self.keys[start:start + self.words]):
+            key = key << WORD_BITS | word
+        return key
+
+    def _resize(self, capacity):
+        """ an empty table of capacity slots, a power of two """
+        self.slots = array('l', [EMPTY]) * capacity
+        self.mask = capacity - 1
+        self.shift = WORD_BITS - (capacity.bit_length() - 1)
+
+    def _slot(self, key, key_hash):
+        """ the slot holding key's index, or the empty slot where it belongs """
+        slots = self.slots
+        hashes = self.hashes
+        mask = self.mask
+        slot = ((key_hash * GOLDEN) & WORD_MASK) >> self.shift
+        while True:
+            index = slots[slot]
+            if index == EMPTY or (hashes[index] == key_hash and self.key(index) == key):
+                return slot
+            slot = (slot + 1) & mask
+
+    def find(self, key, key_hash=None):
+        """ the index of key, or EMPTY if it hasn't been added """
+        if key_hash is None:
+            key_hash = hash(key)
+        return self.slots[self._slot(key, key_hash)]
+
+    def add(self, key, parent, move, key_hash=None):
+        """
+        adds key, reached from the state at index parent (EMPTY for the start) by move,
+        returning its index, or EMPTY if it had already been added
+        """
+        if key_hash is None:
+            key_hash = hash(key)
+        slot = self._slot(key, key_hash)
+        if self.slots[slot] != EMPTY:
+            return EMPTY
+        index = len(self.parents)
+        self.hashes.append(key_hash)
+        if self.words == 1:
+            self.keys.append(key)
+        else:
+            for _ in xrange(self.words):
+                self.keys.append(key & WORD_MASK)
+                key >>= WORD_BITS
+        self.parents.append(parent)
+        self.moves.append(move)
+        self.slots[slot] = index
+        if 2 * len(self.parents) > len(self.slots):
+            self._grow()
+        return index
+
+    def _grow(self):
+        self._rehash(2 * len(self.slots))
+
+    def rebuild(self):
+        """ the hash table again, after states have been appended to the columns directly """
+        capacity = len(self.slots)
+        while 2 * len(self.parents) > capacity:
+            capacity *= 2
+        self._rehash(capacity)
+
+    def _rehash(self, capacity):
+        self._resize(capacity)
+        slots = self.slots
+        mask = self.mask
+        for index, key_hash in enumerate(self.hashes):
+            # every key is distinct, so only an empty slot has to be found
+            slot = ((key_hash * GOLDEN) & WORD_MASK) >> self.shift
+            while slots[slot] != EMPTY:
+                slot = (slot + 1) & mask
+            slots[slot] = index
+
+    def path(self, index):
+        """ the list of moves from the start to the state at index """
+        moves = []
+        while self.parents[index] != EMPTY:
+            moves.append(self.moves[index])
+            index = self.parents[index]
+        moves.reverse()
+        return moves
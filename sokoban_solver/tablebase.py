@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+# A tablebase of every solvable position of a level, for instant hints.
+#
+# A breadth-first search of pulls from every solved position - all the boxes
+# on targets, with the person in any of the regions left free - reaches every
+# push-level state (see pushsearch) from which the level can be solved, in
+# order of the fewest pushes it takes.  The tablebase is a file of those
+# states, encoded as in Level.encode with the region's cell for the person,
+# as fixed-width big-endian keys in ascending order, followed by the pushes
+# each one needs, two bytes each, after a header identifying the level.  It
+# is memory mapped and binary searched, so a position is looked up without
+# reading in the file.
+#
+# From any position, the best next push is then one leading to a state which
+# needs one push fewer, and a position not in the tablebase can't be solved.
+
+import mmap
+import struct
+from sokoban_solver import read_levels
+from pushsearch import reachable, normalise, pushes, pulls, push, goal_states, moves_for_pushes
+
+MAGIC = 'SOKOTBL1'
+# magic, key bytes, number of states, level digest
+HEADER = struct.Struct('<8sIQ20s')
+PUSHES = struct.Struct('>H')
+
+
+def build(level):
+    """ (key, pushes) for every state of level from which it can be solved, in ascending order of key """
+    distances = {}
+    frontier = goal_states(level)
+    for key in frontier:
+        distances[key] = 0
+    pushes_left = 0
+    while frontier:
+        pushes_left += 1
+        next_frontier = []
+        for boxes, region in frontier:
+            for box_cell, direction, to_cell in pulls(level, boxes, reachable(level, region, boxes)):
+                new_boxes = push(level, boxes, box_cell, to_cell)
+                new_key = (new_boxes, normalise(level, level.neighbours[direction][to_cell], new_boxes)[0])
+                if new_key not in distances:
+                    distances[new_key] = pushes_left
+                    next_frontier.append(new_key)
+        frontier = next_frontier
+    if pushes_left > 1 << 16:
+        raise Exception("level needs too many pushes for a tablebase")
+    return sorted((level.encode(region, boxes), pushes) for (boxes, region), pushes in distances.iteritems())
+
+
+def _key_bytes(level):
+    return (level.key_bits() + 7) // 8
+
+
+def _pack_key(key, key_bytes):
+    return ('%0*x' % (2 * key_bytes, key)).decode('hex')
+
+
+def write(path, level, entries):
+    key_bytes = _key_bytes(level)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, key_bytes, len(entries), level.digest()))
+        for key, _ in entries:
+            f.write(_pack_key(key, key_bytes))
+        for _, pushes_left in entries:
+            f.write(PUSHES.pack(pushes_left))
+
+
+class Tablebase(object):
+    """ the tablebase in the file at path, built for level """
+
+    def __init__(self, path, level):
+        with open(path, 'rb') as f:
+            self.table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.key_bytes, self.count, digest = HEADER.unpack(self.table[:HEADER.size])
+        if magic != MAGIC:
+            raise Exception("{} is not a tablebase".format(path))
+        if self.key_bytes != _key_bytes(level) or digest != level.digest():
+            raise Exception("tablebase {} was built for a different level".format(path))
+        self.level = level
+        self.pushes_start = HEADER.size + self.count * self.key_bytes
+
+    def close(self):
+        self.table.close()
+
+    def __len__(self):
+        return self.count
+
+    def _find(self, boxes, region):
+        """ the pushes needed from the state, or None if it can't be solved """
+        table = self.table
+        size = self.key_bytes
+        wanted = _pack_key(self.level.encode(region, boxes), size)
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            start = HEADER.size + middle * size
+            if table[start:start + size] < wanted:
+                low = middle + 1
+            else:
+                high = middle
+        start = HEADER.size + low * size
+        if low == self.count or table[start:start + size] != wanted:
+            return None
+        start = self.pushes_start + low * PUSHES.size
+        return PUSHES.unpack(table[start:start + PUSHES.size])[0]
+
+    def pushes_left(self, state):
+        """ the fewest pushes needed to solve state, or None if it can't be solved """
+        region, _ = normalise(self.level, state.person, state.boxes)
+        return self._find(state.boxes, region)
+
+    def next_push(self, state):
+        """ (box_cell, direction) of a push on the way to solving state in the fewest pushes, or None """
+        level = self.level
+        region, reached = normalise(level, state.person, state.boxes)
+        left = self._find(state.boxes, region)
+        if not left:
+            return None
+        for box_cell, direction, to_cell in pushes(level, state.boxes, reached):
+            new_boxes = push(level, state.boxes, box_cell, to_cell)
+            if self._find(new_boxes, normalise(level, box_cell, new_boxes)[0]) == left - 1:
+                return box_cell, direction
+        raise Exception("tablebase has no way on from a solvable position")
+
+    def hint(self, state):
+        """ the moves of the next push of a solution with the fewest pushes, or None """
+        best = self.next_push(state)
+        if best is None:
+            return None
+        return moves_for_pushes(state, [best])
+
+    def solve(self, state):
+        """ the list of moves of a solution with the fewest pushes, or None if there isn't one """
+        if self.pushes_left(state) is None:
+            return None
+        moves = []
+        while True:
+            steps = self.hint(state)
+            if steps is None:
+                return moves
+            for direction in steps:
+                state = state.move(direction)
+            moves.extend(steps)
+
+
+def main():
+    import sys, argparse
+
+    parser = argparse.ArgumentParser(description="tablebase of every solvable position of a sokoban level")
+    commands = parser.add_subparsers(dest='command')
+    build_command = commands.add_parser('build', help="build the tablebase of a level")
+    build_command.add_argument('level', help="file holding the level, in either notation")
+    build_command.add_argument('tablebase', help="file to write the tablebase to")
+    hint_command = commands.add_parser('hint', help="the best next push from a position of the level")
+    hint_command.add_argument('tablebase', help="the level's tablebase")
+    hint_command.add_argument('position', help="file holding the position, in either notation")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        with open(args.level) as f:
+            _, state = next(read_levels(f))
+        entries = build(state.level)
+        write(args.tablebase, state.level, entries)
+        print >>sys.stderr, "{} solvable positions, the furthest {} pushes from solved".format(
+            len(entries), max(pushes_left for _, pushes_left in entries))
+    else:
+        with open(args.position) as f:
+            _, state = next(read_levels(f))
+        tablebase = Tablebase(args.tablebase, state.level)
+        left = tablebase.pushes_left(state)
+        if left is None:
+            print "no solution"
+        elif not left:
+            print "solved"
+        else:
+            print "{} pushes left, next: {}".format(left, ''.join(tablebase.hint(state)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# Progress reports from the sokoban solver's search engines.
+#
+# Every engine takes a monitor option, and if one is given calls
+#
+#   monitor.update(depth, frontier, visited, generated)
+#
+# once per state it expands, or monitor.layer() with the same once per layer,
+# with the depth of the search, the number of states waiting to be expanded,
+# the number seen so far, and the number of successors generated so far (so
+# that those which had already been seen can be counted).  The monitor only
+# looks at the clock every so many calls, and passes a record to each of its
+# hooks at most once an interval, e.g.
+#
+# {"elapsed": 3.01, "depth": 41, "frontier": 10214, "visited": 380211, "expanded": 370007,
+#  "duplicate_rate": 0.62, "expansions_per_second": 121950, "peak_rss_kb": 81204}
+#
+# Without a monitor the engines only pay for a test against None.
+
+import json
+import resource
+import sys
+import time
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Monitor(object):
+    """
+    passes a progress record to each of hooks, callables taking a dict, every interval seconds
+    while a search runs, using stats, the search's Counter, for the count of states expanded
+    """
+
+    # calls to update() between looks at the clock
+    CHECK_EVERY = 256
+
+    def __init__(self, stats, hooks, interval=1.0):
+        self.stats = stats
+        self.hooks = hooks
+        self.interval = interval
+        self.start = time.time()
+        self.last_time = self.start
+        self.last_expanded = stats['expanded']
+        self.countdown = self.CHECK_EVERY
+        self.latest = None
+
+    def update(self, depth, frontier, visited, generated):
+        self.latest = (depth, frontier, visited, generated)
+        self.countdown -= 1
+        if self.countdown:
+            return
+        self.countdown = self.CHECK_EVERY
+        if time.time() - self.last_time >= self.interval:
+            self.emit()
+
+    def layer(self, depth, frontier, visited, generated):
+        """ as update(), for engines which report once a layer rather than once a state """
+        self.latest = (depth, frontier, visited, generated)
+        if time.time() - self.last_time >= self.interval:
+            self.emit()
+
+    def emit(self):
+        """ passes the latest progress to the hooks straight away """
+        if self.latest is None:
+            return
+        depth, frontier, visited, generated = self.latest
+        now = time.time()
+        expanded = self.stats['expanded']
+        # every state seen but the first was generated once, and every other successor was a repeat
+        duplicates = generated - (visited - 1)
+        record = {
+            'elapsed': round(now - self.start, 3),
+            'depth': depth,
+            'frontier': frontier,
+            'visited': visited,
+            'expanded': expanded,
+            'duplicate_rate': round(float(duplicates) / generated, 4) if generated else 0.0,
+            'expansions_per_second': int((expanded - self.last_expanded) / (now - self.last_time))
+                                     if now > self.last_time else None,
+            'peak_rss_kb': peak_rss_kb(),
+        }
+        self.last_time = now
+        self.last_expanded = expanded
+        for hook in self.hooks:
+            hook(record)
+
+
+def stderr_hook(record):
+    print >>sys.stderr, ("{elapsed:8.1f}s  depth {depth}  frontier {frontier}  visited {visited}  "
+                         "expanded {expanded}  duplicates {duplicate_rate:.1%}  "
+                         "{expansions_per_second}/s  peak {peak_rss_kb} KB").format(**record)
+
+
+class JsonLinesHook(object):
+    """ writes each record as a line of JSON to stream """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def __call__(self, record):
+        self.stream.write(json.dumps(record, sort_keys=True) + '\n')
+        self.stream.flush()
@@ -0,0 +1,104 @@
+# A fixed-size transposition table for the IDA* engine of the sokoban solver.
+#
+# IDA* on its own keeps nothing but its current path, so it searches a state
+# again each time it's reached by a different order of pushes.  The table
+# remembers, for as many states as fit in the memory it's given, the fewest
+# pushes it was reached with in the current iteration, and a lower bound on
+# the pushes left from it, which is raised as the search finds out more (and
+# marks states from which there's no solution at all).  A state reached
+# again in the same iteration with no fewer pushes has nothing new to offer,
+# and is cut off, and the raised bounds carry over into later iterations.
+#
+# The table never grows: each state hashes to a bucket of a few slots, and
+# when they're all full one of them is replaced, by preference one from an
+# earlier iteration, and then the deepest, as a shallow state stands for a
+# bigger subtree.  A new state deeper than everything in its bucket from the
+# current iteration isn't kept.  Like the StateStore, slots are array-backed
+# columns, with keys split into machine words.
+
+from array import array
+from statestore import WORD_BITS, WORD_MASK, GOLDEN
+
+# the lower bound of a state from which there's no solution
+DEAD = -1
+
+# the pushes beyond the bound of a state from which nothing was beyond it
+NOTHING = -1
+
+# slots in each bucket
+WAYS = 4
+
+
+class TranspositionTable(object):
+    """ a table of states of key_bits bits, taking up at most max_bytes """
+
+    def __init__(self, key_bits, max_bytes):
+        self.words = max(1, (key_bits + WORD_BITS - 1) // WORD_BITS)
+        slot_bytes = self.words * array('L').itemsize + 4 * array('l').itemsize
+        buckets = 1
+        while 2 * buckets * WAYS * slot_bytes <= max_bytes:
+            buckets *= 2
+        self.shift = WORD_BITS - (buckets.bit_length() - 1)
+        size = buckets * WAYS
+        self.keys = array('L', [0]) * (size * self.words)
+        self.pushes = array('l', [0]) * size
+        self.bounds = array('l', [0]) * size
+        self.beyond = array('l', [0]) * size
+        # the iteration each slot was written in, 0 for an empty slot
+        self.ages = array('l', [0]) * size
+
+    def __len__(self):
+        return len(self.ages)
+
+    def _bucket(self, key):
+        """ the first slot of key's bucket """
+        if self.shift == WORD_BITS:
+            return 0
+        return (((hash(key) * GOLDEN) & WORD_MASK) >> self.shift) * WAYS
+
+    def _key(self, slot):
+        if self.words == 1:
+            return self.keys[slot]
+        key = 0
+        start = slot * self.words
+        for word in reversed(self.keys[start:start + self.words]):
+            key = key << WORD_BITS | word
+        return key
+
+    def get(self, key):
+        """ (pushes, lower bound, pushes beyond the bound, iteration) stored for key, or None """
+        start = self._bucket(key)
+        for slot in xrange(start, start + WAYS):
+            if self.ages[slot] and self._key(slot) == key:
+                return self.pushes[slot], self.bounds[slot], self.beyond[slot], self.ages[slot]
+        return None
+
+    def put(self, key, pushes, bound, beyond, iteration):
+        """
+        stores key, reached with pushes in iteration, with the lower bound on the pushes left from it,
+        and the least pushes left that went beyond the iteration's bound, if there's room for it
+        """
+        start = self._bucket(key)
+        victim = None
+        for slot in xrange(start, start + WAYS):
+            age = self.ages[slot]
+            if not age or self._key(slot) == key:
+                victim = slot
+                break
+            # the slot least worth keeping: from the oldest iteration, and then the deepest
+            if victim is None or (age, -self.pushes[slot]) < (self.ages[victim], -self.pushes[victim]):
+                victim = slot
+        else:
+            if self.ages[victim] == iteration and self.pushes[victim] < pushes:
+                return
+        if self.words == 1:
+            self.keys[victim] = key
+        else:
+            start = victim * self.words
+            for i in xrange(self.words):
+                self.keys[start + i] = key & WORD_MASK
+                key >>= WORD_BITS
+        self.pushes[victim] = pushes
+        self.bounds[victim] = bound
+        self.beyond[victim] = beyond
+        self.ages[victim] = iteration
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+# Bulk checking of solutions to a level for the sokoban solver.
+#
+# Each solution, a string of moves, is replayed on a board of a byte per cell,
+# 1 for a box, kept in a bytearray which is reset and reused for every
+# solution, rather than by making a new BoardState for every move.  A running
+# count of boxes on targets shows whether the level is solved at the end.
+# Moves are U, D, L and R, in either case, as in the usual notation, where
+# upper case marks a push, though here either case will do for either.
+#
+# Solutions are checked in a pool of processes, in chunks, and a result is
+# written for each one, in order, as a line of JSON, e.g.
+#
+# {"solution": 3, "status": "illegal", "first_illegal": 41, "move_count": 41, "pushes": 12}
+#
+# where status is valid, for a solution that ends with the level solved,
+# unsolved, for one that ends with it not solved, or illegal, for one with a
+# move into a wall or an immovable box, or a character that isn't a move, in
+# which case first_illegal is its index, and the counts are of the moves
+# before it.
+
+import collections
+import json
+import multiprocessing
+from sokoban_solver import BoardState, DIRECTIONS, Level, read_levels
+
+STATUSES = ('valid', 'unsolved', 'illegal')
+
+
+class Replayer(object):
+    """ replays moves from a level's starting position """
+
+    def __init__(self, state):
+        level = state.level
+        self.neighbours = {}
+        for direction in DIRECTIONS:
+            self.neighbours[direction] = self.neighbours[direction.lower()] = level.neighbours[direction]
+        self.start = bytearray(len(level.cells))
+        for cell in level.indexes(state.boxes):
+            self.start[cell] = 1
+        self.targets = bytearray(len(level.cells))
+        for cell in level.indexes(level.targets):
+            self.targets[cell] = 1
+        self.person = state.person
+        self.target_count = len(level.indexes(level.targets))
+        self.on_targets = len(level.indexes(state.boxes & level.targets))
+        self.solvable = len(level.indexes(state.boxes)) == self.target_count
+        self.board = bytearray(self.start)
+
+    def replay(self, moves):
+        """ (status, index of the first illegal move or None, moves made, pushes made) """
+        board = self.board
+        board[:] = self.start
+        targets = self.targets
+        neighbours = self.neighbours
+        person = self.person
+        on_targets = self.on_targets
+        pushes = 0
+        for i, move in enumerate(moves):
+            step = neighbours.get(move)
+            if step is None:
+                return 'illegal', i, i, pushes
+            to_cell = step[person]
+            if to_cell is None:
+                return 'illegal', i, i, pushes
+            if board[to_cell]:
+                beyond = step[to_cell]
+                if beyond is None or board[beyond]:
+                    return 'illegal', i, i, pushes
+                board[to_cell] = 0
+                board[beyond] = 1
+                on_targets += targets[beyond] - targets[to_cell]
+                pushes += 1
+            person = to_cell
+        solved = self.solvable and on_targets == self.target_count
+        return 'valid' if solved else 'unsolved', None, len(moves), pushes
+
+
+def make_result(number, status, first_illegal, move_count, pushes):
+    result = collections.OrderedDict()
+    result['solution'] = number
+    result['status'] = status
+    result['first_illegal'] = first_illegal
+    result['move_count'] = move_count
+    result['pushes'] = pushes
+    return result
+
+
+# the worker's replayer, for the level the pool was started for
+_replayer = None
+
+
+def _init_worker(board, target_locations, person, boxes):
+    global _replayer
+    _replayer = Replayer(BoardState(Level(board, target_locations), person, boxes))
+
+
+def _replay_chunk(chunk):
+    return [_replayer.replay(moves) for moves in chunk]
+
+
+def _chunks(solutions, size):
+    chunk = []
+    for moves in solutions:
+        chunk.append(moves)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def read_solutions(stream):
+    """ generates the solutions in stream, one to a line, skipping blank lines, such as a trailing one """
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def validate_all(state, solutions, processes=None, chunk_size=1000):
+    """
+    generates a result for each of solutions, strings of moves from state, in order, replaying them in
+    processes worker processes (by default one per cpu), or in this one if processes is 1
+    """
+    if processes == 1:
+        replayer = Replayer(state)
+        for number, moves in enumerate(solutions, 1):
+            yield make_result(number, *replayer.replay(moves))
+        return
+
+    level = state.level
+    pool = multiprocessing.Pool(processes, _init_worker,
+                                (level.board, level.target_locations, state.person, state.boxes))
+    try:
+        number = 0
+        for replayed in pool.imap(_replay_chunk, _chunks(solutions, chunk_size)):
+            for outcome in replayed:
+                number += 1
+                yield make_result(number, *outcome)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def main():
+    import sys, argparse
+
+    parser = argparse.ArgumentParser(description="check solutions to a sokoban level")
+    parser.add_argument('level', help="file holding the level, in either notation")
+    parser.add_argument('solutions', help="file of solutions, a string of moves on each line, blank lines skipped")
+    parser.add_argument('--processes', type=int,
+                        help="number of worker processes (default: one per cpu)")
+    parser.add_argument('--chunk-size', type=int, default=1000,
+                        help="solutions sent to a worker at a time (default: 1000)")
+    parser.add_argument('--output', help="file to write the results to (default: stdout)")
+    args = parser.parse_args()
+
+    with open(args.level) as f:
+        _, state = next(read_levels(f))
+    output = open(args.output, 'w') if args.output else sys.stdout
+    counts = collections.Counter()
+    with open(args.solutions) as f:
+        for result in validate_all(state, read_solutions(f), args.processes, args.chunk_size):
+            counts[result['status']] += 1
+            output.write(json.dumps(result) + '\n')
+    output.flush()
+    print >>sys.stderr, ', '.join('{} {}'.format(counts[status], status) for status in STATUSES)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# Vectorized breadth-first search for the sokoban solver, using NumPy.
+#
+# The same step-by-step search as solve_bfs(), but a whole depth layer at a
+# time, with no Python calls per state.  A layer is held as NumPy columns of
+# box bitboards (uint64) and person cell indexes, and for each direction the
+# successors of the entire layer are worked out at once, by looking up the
+# neighbour tables and masking against the boxes.  States are encoded as in
+# Level.encode, which has to fit in 64 bits, and duplicates are weeded out
+# with np.unique, and a binary search of the sorted array of states seen.
+#
+# Pushes onto dead squares are masked out with the rest, and only the pushes
+# left are checked one by one for frozen boxes (see deadlocks), so the same
+# states are pruned as by solve_bfs().  The moves found are as few, though
+# where there's more than one shortest solution, they may not be the same.
+#
+# NumPy is optional - without it, this engine raises an exception.
+
+import deadlocks
+from sokoban_solver import DIRECTIONS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class VectorLevel(object):
+    """ the tables of a Level as NumPy arrays """
+
+    def __init__(self, level):
+        if np is None:
+            raise Exception("the vectorized engine needs numpy")
+        if level.key_bits() > 64:
+            raise Exception("level has too many cells for the vectorized engine, at most {} are allowed".format(
+                64 - level.person_bits))
+        self.level = level
+        self.bits = np.array(level.bits, dtype=np.uint64)
+        self.neighbours = dict((direction, np.array([-1 if cell is None else cell
+                                                     for cell in level.neighbours[direction]], dtype=np.int64))
+                               for direction in DIRECTIONS)
+        self.person_bits = np.uint64(level.person_bits)
+        self.person_mask = np.uint64((1 << level.person_bits) - 1)
+        self.targets = np.uint64(level.targets)
+        self.dead = np.uint64(level.precomputed('dead_squares', deadlocks.dead_squares))
+
+    def encode(self, persons, boxes):
+        return (boxes << self.person_bits) | persons.astype(np.uint64)
+
+    def decode(self, keys):
+        """ keys -> (persons, boxes) """
+        return (keys & self.person_mask).astype(np.int64), keys >> self.person_bits
+
+    def successors(self, persons, boxes, direction):
+        """
+        (indexes, persons, boxes, pruned count) of the legal moves in direction from each of the
+        states of a layer, where indexes are the states they're from
+        """
+        zero = np.uint64(0)
+        neighbours = self.neighbours[direction]
+
+        to_cells = neighbours[persons]
+        can_step = to_cells >= 0
+        to_cells = np.where(can_step, to_cells, 0)
+        to_bits = self.bits[to_cells]
+        pushing = can_step & ((boxes & to_bits) != zero)
+
+        beyond = neighbours[to_cells]
+        beyond_free = beyond >= 0
+        beyond = np.where(beyond_free, beyond, 0)
+        beyond_bits = self.bits[beyond]
+        beyond_free &= (boxes & beyond_bits) == zero
+
+        legal = can_step & (~pushing | beyond_free)
+        new_boxes = np.where(pushing, (boxes ^ to_bits) | beyond_bits, boxes)
+
+        # pushes onto dead squares go all at once, and the rest are checked for frozen boxes
+        pushed = legal & pushing
+        dead = pushed & ((beyond_bits & self.dead) != zero)
+        pruned = int(np.count_nonzero(dead))
+        legal &= ~dead
+        level = self.level
+        for i in np.nonzero(legal & pushing)[0]:
+            if deadlocks.is_deadlock(level, int(new_boxes[i]), int(beyond[i])):
+                legal[i] = False
+                pruned += 1
+
+        indexes = np.nonzero(legal)[0]
+        return indexes, to_cells[indexes], new_boxes[indexes], pruned
+
+
+def solve(state, stats, monitor=None):
+    """
+    breadth-first search of board states, one person step at a time, a whole layer at a time with
+    NumPy, returning the list of moves, or None if there is no solution.  Progress is reported to
+    monitor, if given, once a layer.
+    """
+    vector_level = VectorLevel(state.level)
+
+    start = vector_level.encode(np.array([state.person], dtype=np.int64), np.array([state.boxes], dtype=np.uint64))
+    visited = start
+    persons, boxes = vector_level.decode(start)
+    # for each layer after the first, the index in the layer before of each state's parent, and
+    # the direction it moved in
+    parents = []
+    directions = []
+    generated = 0
+
+    while len(boxes):
+        stats['expanded'] += len(boxes)
+        solved = np.nonzero(boxes == vector_level.targets)[0]
+        if len(solved):
+            index = int(solved[0])
+            moves = []
+            for layer_parents, layer_directions in zip(reversed(parents), reversed(directions)):
+                moves.append(DIRECTIONS[layer_directions[index]])
+                index = int(layer_parents[index])
+            moves.reverse()
+            return moves
+
+        candidate_indexes = []
+        candidate_keys = []
+        candidate_directions = []
+        for i, direction in enumerate(DIRECTIONS):
+            indexes, new_persons, new_boxes, pruned = vector_level.successors(persons, boxes, direction)
+            stats['pruned'] += pruned
+            candidate_indexes.append(indexes)
+            candidate_keys.append(vector_level.encode(new_persons, new_boxes))
+            candidate_directions.append(np.full(len(indexes), i, dtype=np.int8))
+        candidate_indexes = np.concatenate(candidate_indexes)
+        candidate_keys = np.concatenate(candidate_keys)
+        candidate_directions = np.concatenate(candidate_directions)
+        generated += len(candidate_keys)
+
+        keys, first = np.unique(candidate_keys, return_index=True)
+        positions = np.searchsorted(visited, keys)
+        seen = positions < len(visited)
+        seen[seen] = visited[positions[seen]] == keys[seen]
+        keys = keys[~seen]
+        first = first[~seen]
+
+        parents.append(candidate_indexes[first])
+        directions.append(candidate_directions[first])
+        visited = np.union1d(visited, keys)
+        persons, boxes = vector_level.decode(keys)
+        if monitor is not None:
+            monitor.layer(len(parents), len(keys), len(visited), generated)
+
+    return None